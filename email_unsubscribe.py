@@ -1,15 +1,34 @@
 import imaplib
+import asyncio
+import ssl
 import email
+import email.policy
 from email.header import decode_header
+from email.message import EmailMessage
+import html
 import sys
 import re
 import webbrowser
 from rich.console import Console
-from rich.prompt import Prompt
+from rich.prompt import Confirm, Prompt
 from rich.table import Table
 from tqdm import tqdm
 import json
+import sqlite3
+import hashlib
 import os
+import argparse
+import time
+import http.client
+import smtplib
+import queue
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
+from itertools import chain
+from operator import attrgetter
+from collections import deque, namedtuple
+from datetime import date, datetime, timedelta
+from urllib.parse import urlsplit, parse_qsl, unquote
 
 
 # Constants for IMAP servers
@@ -18,11 +37,94 @@ IMAP_SERVERS = {
     "yahoo.com": "imap.mail.yahoo.com",
 }
 
+# SMTP servers used to send mailto: unsubscribe emails
+SMTP_SERVERS = {
+    "gmail.com": "smtp.gmail.com",
+    "yahoo.com": "smtp.mail.yahoo.com",
+}
+
+# Seconds between two unsubscribe emails, to stay under each provider's sending limits
+SMTP_SEND_INTERVALS = {
+    "gmail.com": 1.0,
+    "yahoo.com": 2.0,
+}
+
+# Concurrent IMAP sessions each provider allows per account
+IMAP_MAX_CONNECTIONS = {
+    "gmail.com": 15,
+    "yahoo.com": 5,
+}
+
 SKIP_FILE = "skipped.txt"  # File to store skipped email addresses
+SKIP_COMPACT_RATIO = 0.2  # Share of duplicate lines that triggers rewriting the skip file
 HISTORY_FILE = "history.json"  # File to store unsubscribed email addresses
+HISTORY_LOG_FILE = "history.log"  # Entries added to the history since it was last compacted
+HISTORY_COMPACT_ENTRIES = 500  # Log entries that trigger rewriting the history file
+UNSUBSCRIBE_LOG_FILE = "unsubscribe_log.jsonl"  # Outcome of every unsubscribe request sent, one JSON record per line
+SYNC_FILE = "sync_state.db"  # SQLite database storing per-folder UIDVALIDITY/MODSEQ checkpoints and scan results
+DEFAULT_FOLDER = "inbox"
+IMAP_SSL_PORT = 993
+SMTP_SSL_PORT = 465
+SMTP_TIMEOUT = 30  # Seconds to wait on the SMTP server
+SMTP_SEND_INTERVAL = 2.0  # Seconds between unsubscribe emails for providers not listed above
+PIPELINE_DEPTH = 4  # UID FETCH commands kept in flight by the asyncio engine
+IMAP_COMMAND_TIMEOUT = 60  # Seconds the asyncio engine waits for a command to complete
+QRESYNC_KNOWN_UIDS_LIMIT = 1000  # Longest known-UID set sent along with a QRESYNC select
+CLEANUP_SET_LIMIT = 1000  # Longest UID set sent in one MOVE, STORE or EXPUNGE command, well within server line limits
+FETCH_BATCH_SIZE = 500  # Number of messages requested per IMAP FETCH command
+PARSE_BATCH_SIZE = 50  # Messages sent to a parse worker process at a time
+PARSE_QUEUE_SIZE = 8  # Batches waiting for a parse worker before the asyncio engine stops reading
+
+# FETCH queries for whole messages and for just the headers the scan needs, peeking so \Seen flags are left alone
+FULL_MESSAGE_QUERY = "(BODY.PEEK[])"
+FULL_MESSAGE_ITEM = "BODY[]"  # Response attribute holding the whole message
+HEADER_FIELDS = ("From", "Subject", "List-Unsubscribe", "List-Unsubscribe-Post")
+HEADER_QUERY = f"(BODY.PEEK[HEADER.FIELDS ({' '.join(HEADER_FIELDS)})])"
+BODY_MODES = ("full", "html", "tail")  # How much of a message body to download when it is needed
+TAIL_FETCH_SIZE = 8 * 1024  # Bytes fetched from the end of an HTML part in "tail" mode
+SEARCH_CRITERIA = 'HEADER List-Unsubscribe ""'  # Only bulk mail carries this header
+SEARCH_SINCE_DAYS = 365  # Only search emails received in this many days (0 searches everything)
+SENDER_SWEEP_BATCH_SIZE = 5000  # Messages per FETCH when sweeping From headers
+ANCHOR_TEXT_LIMIT = 256  # Characters of link text kept when looking for unsubscribe wording
+ANCHOR_WINDOW_SIZE = 4096  # Bytes after an anchor tag searched for its text
+SENDER_QUERY = "(BODY.PEEK[HEADER.FIELDS (From)])"
+ONE_CLICK_BODY = b"List-Unsubscribe=One-Click"  # RFC 8058 request body
+ONE_CLICK_USER_AGENT = "email-unsubscriber"
+ONE_CLICK_WORKERS = 8  # Connections sending one-click requests at the same time
+ONE_CLICK_CONNECTIONS_PER_HOST = 2  # Keep-alive connections opened to a single host
+ONE_CLICK_TIMEOUT = 10  # Seconds to wait on a one-click request
+ONE_CLICK_RETRIES = 2  # Extra attempts after a network error or a 429/5xx answer
+ONE_CLICK_RETRY_DELAY = 1.0  # Seconds before the first retry, doubled for every other one
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")  # IMAP date names
 
 console = Console()
 
+# Where a scanned message lives on the server, so it can be fetched again on demand
+MessageHandle = namedtuple("MessageHandle", ["account", "folder", "uidvalidity", "uid"])
+
+
+class ScanResult:
+    """An email listed for unsubscribing, kept small since scans can hold many of them.
+
+    Sender strings are interned, so the many results of one sender share them,
+    and links are stored as a tuple.
+    """
+
+    __slots__ = ("subject", "sender", "email", "unsubscribe_links", "handle", "one_click_url", "mailto_url")
+
+    def __init__(self, subject, sender, email, unsubscribe_links, handle=None, one_click_url=None,
+                 mailto_url=None):
+        self.subject = subject
+        self.sender = sys.intern(sender)
+        self.email = sys.intern(email)
+        self.unsubscribe_links = tuple(unsubscribe_links)
+        self.handle = handle  # Where to re-fetch the message from for debugging
+        self.one_click_url = one_click_url  # RFC 8058 URL that unsubscribes with a single POST
+        self.mailto_url = mailto_url  # List-Unsubscribe address that unsubscribes by email
+
+    def __repr__(self):
+        return f"ScanResult({self.sender!r}, {self.email!r}, {self.subject!r})"
+
 def connect_to_email(email_address, password):
     domain = email_address.split("@")[-1]
     imap_server = IMAP_SERVERS.get(domain)
@@ -45,19 +147,195 @@ def connect_to_email(email_address, password):
     console.print("[green]Login successful![/green]")
     return mail
 
-def extract_links_from_html(html):
-    """Extract all links from HTML content and filter unsubscribe-related links."""
-    # Extract all <a href="...">...</a> links
-    all_links = re.findall(r'<a\s+[^>]*href=["\'](https?://[^"\']+)["\'][^>]*>(.*?)</a>', html, re.IGNORECASE)
-    
+def open_connection_pool(email_address, password, connections, folder=DEFAULT_FOLDER):
+    """Log in extra sessions to the account and select folder read-only in each.
+
+    ``connections`` counts the main connection too, so connections - 1 sessions are
+    returned, capped by the provider's limit on concurrent connections.
+    """
+    domain = email_address.split("@")[-1]
+    limit = IMAP_MAX_CONNECTIONS.get(domain, 1)
+    if connections > limit:
+        console.print(f"[yellow]{domain} allows at most {limit} connections, using {limit}.[/yellow]")
+        connections = limit
+
+    sessions = []
+    for _ in range(connections - 1):
+        try:
+            session = imaplib.IMAP4_SSL(IMAP_SERVERS[domain])
+            session.login(email_address, password)
+            select_folder(session, folder, readonly=True)
+        except (imaplib.IMAP4.error, OSError) as e:
+            console.print(f"[yellow]Could not open another connection ({e}), using {len(sessions) + 1}.[/yellow]")
+            break
+        sessions.append(session)
+
+    if sessions:
+        console.print(f"[green]Opened {len(sessions)} extra connections.[/green]")
+    return sessions
+
+def quote_imap_string(value):
+    """Quote a value as an IMAP string."""
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def build_search_criteria(search=SEARCH_CRITERIA, since_days=SEARCH_SINCE_DAYS, gmail_raw=None):
+    """Build the IMAP SEARCH criteria the server uses to pick candidate emails."""
+    criteria = [search or "ALL"]
+    if since_days:
+        since = date.today() - timedelta(days=since_days)
+        criteria.append(f"SINCE {since.day}-{MONTHS[since.month - 1]}-{since.year}")
+    if gmail_raw:
+        criteria.append(f"X-GM-RAW {quote_imap_string(gmail_raw)}")
+    return " ".join(criteria)
+
+def compact_sequence_set(ids):
+    """Collapse message numbers into an IMAP sequence set such as 1201:1700,1705."""
+    numbers = sorted(set(int(i) for i in ids))
+    ranges = []
+    start = end = numbers[0]
+    for number in numbers[1:]:
+        if number == end + 1:
+            end = number
+            continue
+        ranges.append(f"{start}:{end}" if start != end else str(start))
+        start = end = number
+    ranges.append(f"{start}:{end}" if start != end else str(start))
+    return ",".join(ranges)
+
+# Tokens of an IMAP response: parentheses, quoted strings, literal markers and atoms
+# (atoms may carry a section such as BODY[HEADER.FIELDS (FROM)]<0>)
+IMAP_TOKEN_RE = re.compile(
+    rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|\{(\d+)\}$|([^\s()"\[]+(?:\[[^\]]*\](?:<[\d.]+>)?)?))'
+)
+
+def parse_imap_response(segments):
+    """Parse IMAP response text into nested lists.
+
+    ``segments`` alternates response text and literal data, which is how imaplib
+    hands back a response line that carries {n} literals.
+    """
+    stack = [[]]
+    for position, segment in enumerate(segments):
+        if position % 2:
+            stack[-1].append(segment)  # Literal data is taken as-is
+            continue
+        for match in IMAP_TOKEN_RE.finditer(segment):
+            opening, closing, quoted, literal, atom = match.groups()
+            if opening:
+                stack.append([])
+            elif closing:
+                if len(stack) > 1:
+                    items = stack.pop()
+                    stack[-1].append(items)
+            elif quoted is not None:
+                stack[-1].append(re.sub(rb"\\(.)", rb"\1", quoted))
+            elif atom is not None:
+                stack[-1].append(None if atom.upper() == b"NIL" else atom)
+            # Literal markers are skipped, their data is the next segment
+    return stack[0]
+
+def iter_fetch_responses(msg_data):
+    """Yield (message number, attributes) for every FETCH response in msg_data."""
+    segments = []
+    for response_part in msg_data:
+        if response_part is None:
+            continue
+        if isinstance(response_part, tuple):
+            segments.extend(response_part)
+            continue
+        segments.append(response_part)
+        tokens = parse_imap_response(segments)
+        segments = []
+        if len(tokens) < 2 or not isinstance(tokens[1], list):
+            continue
+        yield int(tokens[0]), fetch_response_attributes(tokens[1])
+
+def fetch_response_attributes(values):
+    """Turn the parenthesized list of a FETCH response into a dict keyed by attribute name."""
+    return {
+        name.decode().upper(): value
+        for name, value in zip(values[::2], values[1::2])
+        if isinstance(name, bytes)
+    }
+
+# Bytes patterns for anchors in undecoded HTML: the opening tag with its attributes,
+# the href value (quoted or bare), the closing tag and any tag inside the anchor text
+HTML_ANCHOR_TAG_RE = re.compile(rb"<a(\s[^>]*)>", re.IGNORECASE)
+HTML_HREF_RE = re.compile(rb"""\shref\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""", re.IGNORECASE)
+HTML_ANCHOR_CLOSE_RE = re.compile(rb"</a\s*>", re.IGNORECASE)
+HTML_TAG_RE = re.compile(rb"<[^>]*>")
+
+def is_unsubscribe_link(url, text):
+    """Return whether an anchor looks like an unsubscribe link."""
+    text = " ".join(text.lower().split())  # Anchors may span lines
+    # Include links if the text or URL contains "unsubscribe" or "click here"
+    return "unsubscribe" in text or "click here" in text or "unsubscribe" in url.lower()
+
+def scan_anchors(data, final=True):
+    """Return the unsubscribe links of the anchors in HTML bytes and the bytes left to scan.
+
+    Unless ``final`` is set, more of the HTML may follow, so an anchor whose text
+    could still continue and a tag cut off at the end are handed back instead.
+    """
+    last_tag_end = data.rfind(b">")
+    tags = list(HTML_ANCHOR_TAG_RE.finditer(data, 0, last_tag_end + 1))
     unsubscribe_links = []
-    for url, text in all_links:
-        # Include links if the text or URL contains "unsubscribe" or "click here"
-        if "unsubscribe" in text.lower() or "click here" in text.lower() or "unsubscribe" in url.lower():
+    close = None
+    for index, tag in enumerate(tags):
+        # The text runs to the closing tag, or to the next anchor when the closing tag is missing
+        end = tags[index + 1].start() if index + 1 < len(tags) else len(data)
+        if close is None or (close and close.start() < tag.end()):
+            close = HTML_ANCHOR_CLOSE_RE.search(data, tag.end()) or False  # False: no closing tags left
+        if close:
+            end = min(end, close.start())
+        if not final and end == len(data) and len(data) < tag.end() + ANCHOR_WINDOW_SIZE:
+            return unsubscribe_links, data[tag.start():]  # The text may go on in the next chunk
+        end = min(end, tag.end() + ANCHOR_WINDOW_SIZE)
+
+        href = HTML_HREF_RE.search(tag.group(1))
+        if not href:
+            continue
+        url = html.unescape((href.group(1) or href.group(2) or href.group(3)).decode(errors="ignore"))
+        if not url.lower().startswith(("http://", "https://")):
+            continue
+        text = HTML_TAG_RE.sub(b"", data[tag.end():end]).decode(errors="ignore")
+        if is_unsubscribe_link(url, html.unescape(text)[:ANCHOR_TEXT_LIMIT]):
             unsubscribe_links.append(url)
-    
+    # Keep what may be the start of a tag, up to a window
+    return unsubscribe_links, b"" if final else data[max(last_tag_end + 1, len(data) - ANCHOR_WINDOW_SIZE):]
+
+def extract_links_from_html_bytes(data):
+    """Extract unsubscribe-related links from undecoded HTML bytes.
+
+    Anchors are found with bytes patterns, so only the URLs and the anchor text
+    get decoded instead of the whole body. ``data`` can also be an iterable of
+    chunks of the HTML, such as a body read in pieces, which are scanned as they
+    come; only an unfinished anchor and its text, or an unfinished tag, are
+    carried over to the next chunk.
+    """
+    if isinstance(data, (bytes, bytearray)):
+        return scan_anchors(data)[0]
+    unsubscribe_links = []
+    rest = b""
+    for chunk in data:
+        links, rest = scan_anchors(rest + chunk, final=False)
+        unsubscribe_links.extend(links)
+    unsubscribe_links.extend(scan_anchors(rest)[0])
     return unsubscribe_links
 
+def extract_one_click_url(msg):
+    """Return the RFC 8058 one-click unsubscribe URL of a message, or None when it offers none."""
+    list_unsubscribe_post = msg.get("List-Unsubscribe-Post") or ""
+    if "list-unsubscribe=one-click" not in list_unsubscribe_post.replace(" ", "").lower():
+        return None
+    match = re.search(r"<(https://[^>]+)>", msg.get("List-Unsubscribe") or "")  # One-click URLs must be HTTPS
+    return match.group(1) if match else None
+
+def extract_mailto_url(msg):
+    """Return the mailto: unsubscribe URL of the List-Unsubscribe header, or None when it offers none."""
+    match = re.search(r"<(mailto:[^>]+)>", msg.get("List-Unsubscribe") or "", re.IGNORECASE)
+    return match.group(1) if match else None
+
 def extract_unsubscribe_links(msg):
     """Extract unsubscribe links from email headers and body."""
     unsubscribe_links = []
@@ -74,18 +352,14 @@ def extract_unsubscribe_links(msg):
         for part in msg.walk():
             content_type = part.get_content_type()
             if content_type == "text/html":
-                body = part.get_payload(decode=True).decode(errors="ignore")
-
                 # Find unsubscribe links in the HTML content
-                unsubscribe_links.extend(extract_links_from_html(body))
+                unsubscribe_links.extend(extract_links_from_html_bytes(part.get_payload(decode=True)))
     else:
         # Single-part message
         content_type = msg.get_content_type()
         if content_type == "text/html":
-            body = msg.get_payload(decode=True).decode(errors="ignore")
-
             # Find unsubscribe links in the HTML content
-            unsubscribe_links.extend(extract_links_from_html(body))
+            unsubscribe_links.extend(extract_links_from_html_bytes(msg.get_payload(decode=True)))
 
     # Remove mailto: links and return unique HTTP/HTTPS links
     unsubscribe_links = [link for link in unsubscribe_links if not link.startswith("mailto:")]
@@ -94,7 +368,7 @@ def extract_unsubscribe_links(msg):
 def display_emails(emails):
     """Display the emails in a table with unsubscribe links."""
     total_emails = len(emails)
-    successful_links = sum(1 for email in emails if email["unsubscribe_links"])
+    successful_links = sum(1 for email in emails if email.unsubscribe_links or email.mailto_url)
 
     table = Table(title=f"Emails with Unsubscribe Links ({successful_links}/{total_emails})")
     table.add_column("Index", justify="center")
@@ -103,246 +377,1767 @@ def display_emails(emails):
     table.add_column("Unsubscribe Links", justify="left")
 
     for idx, email in enumerate(emails):
-        links = "\n".join(email["unsubscribe_links"]) if email["unsubscribe_links"] else "[red]No links found[/red]"
+        targets = email.unsubscribe_links + ((email.mailto_url,) if email.mailto_url else ())
+        links = "\n".join(targets) if targets else "[red]No links found[/red]"
         table.add_row(
             str(idx),
-            email["sender"],
-            email["email"],
+            email.sender,
+            email.email,
             links,
         )
 
     console.print(table)
 
 
-def debug_email(email):
-    """Print headers and body content for debugging."""
+def show_found_email(email):
+    """Print an email as soon as the scan finds it, and return it."""
+    with tqdm.external_write_mode(file=sys.stdout):  # Keep the progress bar intact
+        console.print(f"[green]Found:[/green] {email.sender} <{email.email}> "
+                      f"({len(email.unsubscribe_links)} unsubscribe links)")
+    return email
+
+def fetch_raw_message(mail, handle):
+    """Fetch the full message behind a MessageHandle, or None when it is gone."""
+    uidvalidity, _ = select_folder(mail, handle.folder, readonly=True)
+    if handle.uidvalidity and uidvalidity != handle.uidvalidity:
+        return None  # The folder was rebuilt and the UID points elsewhere
+    for _, msg in fetch_messages(mail, [handle.uid]):
+        return msg
+    return None
+
+def debug_email(email, mail):
+    """Print headers and body content for debugging, fetching the message again from the server."""
+    msg = fetch_raw_message(mail, email.handle) if email.handle else None
+    if msg is None:
+        console.print(f"[red]The message from {email.email} is no longer available.[/red]")
+        return
+
     console.print("[cyan]--- Debugging Information ---[/cyan]")
 
     # Print headers
     console.print("[cyan]Headers:[/cyan]")
-    for header, value in email["raw_msg"].items():
+    for header, value in msg.items():
         console.print(f"[yellow]{header}[/yellow]: {value}")
 
     # Print body content
     console.print("[cyan]Body Content:[/cyan]")
-    if email["raw_msg"].is_multipart():
-        for part in email["raw_msg"].walk():
+    if msg.is_multipart():
+        for part in msg.walk():
             content_type = part.get_content_type()
             if content_type in ["text/plain", "text/html"]:
                 body = part.get_payload(decode=True).decode(errors="ignore")
                 console.print(f"[green]{content_type} (last 500 characters):[/green]")
                 console.print(body[-500:])  # Print last 500 characters
     else:
-        content_type = email["raw_msg"].get_content_type()
+        content_type = msg.get_content_type()
         if content_type in ["text/plain", "text/html"]:
-            body = email["raw_msg"].get_payload(decode=True).decode(errors="ignore")
+            body = msg.get_payload(decode=True).decode(errors="ignore")
             console.print(f"[green]{content_type} (last 500 characters):[/green]")
             console.print(body[-500:])  # Print last 500 characters
 
-def load_skipped_emails():
-    """Load skipped emails from the text file."""
-    if os.path.exists(SKIP_FILE):
-        with open(SKIP_FILE, "r") as f:
-            return set(line.strip() for line in f.readlines())
-    return set()
-
-def save_skipped_email(email):
-    """Save a skipped email to the text file."""
-    with open(SKIP_FILE, "a") as f:
-        f.write(email + "\n")
-
-def load_history():
-    """Load the history from the JSON file."""
-    if not os.path.exists(HISTORY_FILE):
-        return {}
+class SkipStore:
+    """Skipped senders, global or scoped to one account, loaded once into hashed sets.
+
+    Each line of ``SKIP_FILE`` holds a sender address, preceded by an account and
+    a tab when the entry only applies to that account. Lines without a tab are
+    global entries, whatever else they contain. Entries are deduplicated
+    on write, and the file is rewritten without duplicates on load when more than
+    SKIP_COMPACT_RATIO of its lines are duplicates.
+    """
+
+    def __init__(self, path=SKIP_FILE):
+        self.path = path
+        self.accounts = {}  # Account -> set of skipped senders, "" for global entries
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r") as f:
+            lines = [line.strip() for line in f.read().split("\n")]
+        lines = [line for line in lines if line]
+        for line in lines:
+            account, _, address = line.rpartition("\t")
+            self.accounts.setdefault(account, set()).add(address)
+
+        entries = sum(len(addresses) for addresses in self.accounts.values())
+        if lines and (len(lines) - entries) / len(lines) > SKIP_COMPACT_RATIO:
+            self.compact()
+
+    def get(self, account=None):
+        """Return the senders skipped for an account: the global entries plus the account's own."""
+        skipped = set(self.accounts.get("", ()))
+        if account:
+            skipped |= self.accounts.get(account, set())
+        return skipped
+
+    def add_many(self, new_addresses, account=None):
+        """Skip senders, for one account or globally, with a single write and return the ones that were new."""
+        addresses = self.accounts.setdefault(account or "", set())
+        added = [address for address in dict.fromkeys(new_addresses) if address not in addresses]
+        if not added:
+            return added
+        addresses.update(added)
+        with open(self.path, "a") as f:
+            f.write("".join(f"{account}\t{address}\n" if account else address + "\n" for address in added))
+        return added
+
+    def add(self, address, account=None):
+        """Skip a sender, for one account or globally, and return whether it was new."""
+        return bool(self.add_many([address], account))
+
+    def compact(self):
+        """Rewrite the skip file sorted and without duplicates."""
+        lines = sorted(
+            f"{account}\t{address}" if account else address
+            for account, addresses in self.accounts.items()
+            for address in addresses
+        )
+        with open(self.path + ".tmp", "w") as f:
+            f.write("".join(line + "\n" for line in lines))
+        os.replace(self.path + ".tmp", self.path)
+        console.print(f"[green]Removed duplicate entries from {self.path}[/green]")
+
+class HistoryStore:
+    """Unsubscribed senders per user, loaded once and updated through an append-only log.
+
+    ``HISTORY_FILE`` holds a snapshot of the history and ``HISTORY_LOG_FILE`` the
+    entries added since, one JSON record per line. The log is folded back into
+    the snapshot once it grows past HISTORY_COMPACT_ENTRIES entries and when the
+    store is closed.
+    """
+
+    def __init__(self, path=HISTORY_FILE, log_path=HISTORY_LOG_FILE):
+        self.path = path
+        self.log_path = log_path
+        self.users = {}  # User email -> dict of unsubscribed senders, kept in insertion order
+        self.log_entries = 0
+        self.load()
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path, "r") as file:
+                try:
+                    history = json.load(file)
+                    console.print(f"[green]Loaded history from {self.path}[/green]")
+                except json.JSONDecodeError:
+                    console.print(f"[yellow]Failed to load history. Starting with an empty history.[/yellow]")
+                    history = {}
+            for user_email, senders in history.items():
+                self.users[user_email] = dict.fromkeys(senders)
+
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "r") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # A write cut short by a crash
+                    self.users.setdefault(entry["user"], {})[entry["email"]] = None
+                    self.log_entries += 1
+        if self.log_entries >= HISTORY_COMPACT_ENTRIES:
+            self.compact()
+
+    def get(self, user_email):
+        """Return the senders a user unsubscribed from, as a set."""
+        return set(self.users.get(user_email, ()))
+
+    def contains(self, user_email, email_address):
+        return email_address in self.users.get(user_email, ())
+
+    def add_many(self, user_email, email_addresses):
+        """Add senders to a user's history with a single log write and return the ones that were new."""
+        senders = self.users.setdefault(user_email, {})
+        added = [address for address in dict.fromkeys(email_addresses) if address not in senders]
+        if not added:
+            return added
+
+        with open(self.log_path, "a") as file:
+            file.write("".join(json.dumps({"user": user_email, "email": address}) + "\n" for address in added))
+        senders.update(dict.fromkeys(added))
+        self.log_entries += len(added)
+        if self.log_entries >= HISTORY_COMPACT_ENTRIES:
+            self.compact()
+        return added
+
+    def add(self, user_email, email_address):
+        """Add a sender to a user's history and return whether it was new."""
+        return bool(self.add_many(user_email, [email_address]))
+
+    def compact(self):
+        """Write the whole history to the snapshot file and empty the log."""
+        history = {user_email: list(senders) for user_email, senders in self.users.items()}
+        with open(self.path + ".tmp", "w") as file:
+            json.dump(history, file, indent=4)
+        os.replace(self.path + ".tmp", self.path)  # Never leave a half-written snapshot behind
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self.log_entries = 0
+        console.print(f"[green]History saved to {self.path}[/green]")
+
+    def close(self):
+        if self.log_entries:
+            self.compact()
+
+class SessionState:
+    """History and skip data of one run, loaded once and shared by the scan and the interactive loop.
+
+    ``unsubscribed`` and ``skipped`` are the sets of senders that apply to the
+    user; changes are written through the stores, and ``close`` flushes them.
+    """
+
+    def __init__(self, user_email):
+        self.user_email = user_email
+        self.history = HistoryStore()
+        self.skips = SkipStore()
+        self.unsubscribed = self.history.get(user_email)
+        self.skipped = self.skips.get(user_email)
+        self.mailto_queue = {}  # Sender address -> mailto: URL waiting to be sent
+
+    def mark_unsubscribed(self, email_address):
+        """Add a sender to the user's history and return whether it was new."""
+        self.unsubscribed.add(email_address)
+        return self.history.add(self.user_email, email_address)
+
+    def mark_unsubscribed_many(self, email_addresses):
+        """Add senders to the user's history with a single write and return the ones that were new."""
+        self.unsubscribed.update(email_addresses)
+        return self.history.add_many(self.user_email, email_addresses)
 
-    with open(HISTORY_FILE, "r") as file:
+    def queue_mailto(self, email_address, url):
+        """Queue a mailto: unsubscribe, to be sent with the others over one SMTP session."""
+        self.mailto_queue[email_address] = url
+
+    def send_queued_mailto(self, password):
+        """Send the queued mailto: unsubscribes, then record their outcome and the delivered ones in the history."""
+        if not self.mailto_queue:
+            return
+        console.print(f"[blue]Sending {len(self.mailto_queue)} unsubscribe emails...[/blue]")
+        outcomes = send_mailto_unsubscribes(self.user_email, password, list(self.mailto_queue.items()))
+        self.mailto_queue.clear()
+        self.record_outcomes(outcomes)
+
+        delivered = [email_address for email_address, outcome in outcomes.items() if outcome["status"] == "ok"]
+        self.mark_unsubscribed_many(delivered)
+        console.print(f"[green]Sent {len(delivered)} of {len(outcomes)} unsubscribe emails.[/green]")
+        for email_address, outcome in outcomes.items():
+            if outcome["status"] != "ok":
+                console.print(f"[red]Could not unsubscribe from {email_address} by email: {outcome['error']}[/red]")
+
+    def skip(self, email_address, account_only=False):
+        """Skip a sender for every account, or only for the user's, and return whether it was new."""
+        self.skipped.add(email_address)
+        return self.skips.add(email_address, self.user_email if account_only else None)
+
+    def skip_many(self, email_addresses, account_only=False):
+        """Skip senders with a single write and return the ones that were new."""
+        self.skipped.update(email_addresses)
+        return self.skips.add_many(email_addresses, self.user_email if account_only else None)
+
+    def record_outcomes(self, outcomes):
+        """Append the outcome of unsubscribe attempts, keyed by sender address, to the unsubscribe log."""
+        timestamp = datetime.now().isoformat(timespec="seconds")
+        with open(UNSUBSCRIBE_LOG_FILE, "a") as file:
+            file.write("".join(
+                json.dumps({"user": self.user_email, "email": email_address, "time": timestamp, **outcome}) + "\n"
+                for email_address, outcome in outcomes.items()
+            ))
+
+    def close(self):
+        self.history.close()
+
+def post_one_click(connection, url):
+    """Send an RFC 8058 one-click POST over a keep-alive connection and return the HTTP status code."""
+    parts = urlsplit(url)
+    target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    connection.request("POST", target, body=ONE_CLICK_BODY, headers={
+        "Content-Type": "application/x-www-form-urlencoded",
+        "User-Agent": ONE_CLICK_USER_AGENT,
+    })
+    response = connection.getresponse()
+    response.read()  # Drain the body so the connection can be reused
+    return response.status
+
+def run_one_click_requests(scheme, netloc, jobs):
+    """Send the one-click requests of one host over a single keep-alive connection.
+
+    ``jobs`` are (sender address, URL) pairs. Network errors and 429/5xx answers
+    are retried ONE_CLICK_RETRIES times with a growing delay. Returns (sender
+    address, outcome) pairs.
+    """
+    connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+    connection = connection_class(netloc, timeout=ONE_CLICK_TIMEOUT)
+    outcomes = []
+    try:
+        for email_address, url in jobs:
+            outcome = {"method": "one-click", "url": url, "status": "failed", "code": None, "error": None}
+            for attempt in range(ONE_CLICK_RETRIES + 1):
+                if attempt:
+                    time.sleep(ONE_CLICK_RETRY_DELAY * 2 ** (attempt - 1))
+                try:
+                    outcome["code"] = post_one_click(connection, url)
+                    outcome["error"] = None
+                except (OSError, http.client.HTTPException) as e:
+                    connection.close()  # The next request reconnects
+                    outcome["error"] = str(e) or type(e).__name__
+                    continue
+                if outcome["code"] < 400:  # Senders often redirect to a confirmation page
+                    outcome["status"] = "ok"
+                    break
+                if outcome["code"] != 429 and outcome["code"] < 500:
+                    break  # Retrying will not change the answer
+            outcomes.append((email_address, outcome))
+    finally:
+        connection.close()
+    return outcomes
+
+def parse_mailto(url):
+    """Split a mailto: URL into its address, subject and body (RFC 6068)."""
+    parts = urlsplit(url)
+    fields = {name.lower(): value for name, value in parse_qsl(parts.query)}
+    return unquote(parts.path), fields.get("subject", "Unsubscribe"), fields.get("body", "Unsubscribe")
+
+def build_mailto_message(from_address, url):
+    """Build the unsubscribe email a mailto: URL asks for, as CRLF-terminated bytes."""
+    to_address, subject, body = parse_mailto(url)
+    msg = EmailMessage(policy=email.policy.SMTP)
+    msg["From"] = from_address
+    msg["To"] = to_address
+    msg["Subject"] = subject
+    msg.set_content(body)
+    return to_address, msg.as_bytes()
+
+def send_pipelined(server, from_address, to_address, data):
+    """Send one email with MAIL, RCPT and DATA in a single write (RFC 2920) and return the final reply."""
+    server.send(f"MAIL FROM:<{from_address}>\r\nRCPT TO:<{to_address}>\r\nDATA\r\n")
+    replies = [server.getreply() for _ in range(3)]
+    (mail_code, _), (rcpt_code, rcpt_message), (data_code, data_message) = replies
+    if data_code == 354 and mail_code == 250 and rcpt_code in (250, 251):
+        data = re.sub(rb"(?m)^\.", b"..", data)  # Dot-stuffing
+        server.send(data + (b"" if data.endswith(b"\r\n") else b"\r\n") + b".\r\n")
+        return server.getreply()
+
+    if data_code == 354:
+        server.send(b".\r\n")  # End the empty message the server accepted anyway
+        server.getreply()
+    server.rset()
+    return next(((code, message) for code, message in replies if code >= 400), replies[-1])
+
+def send_mailto_unsubscribes(email_address, password, jobs):
+    """Send the unsubscribe emails of mailto: URLs over one authenticated SMTP session.
+
+    ``jobs`` are (sender address, mailto URL) pairs. Commands are pipelined when the
+    server supports it, and emails are spaced out by the provider's rate limit.
+    Returns the outcome of every sender address.
+    """
+    domain = email_address.split("@")[-1]
+    smtp_server = SMTP_SERVERS.get(domain)
+    interval = SMTP_SEND_INTERVALS.get(domain, SMTP_SEND_INTERVAL)
+    outcomes = {
+        sender: {"method": "mailto", "url": url, "status": "failed", "code": None, "error": None}
+        for sender, url in jobs
+    }
+    if not smtp_server:
+        for outcome in outcomes.values():
+            outcome["error"] = f"Unsupported email domain: {domain}"
+        return outcomes
+
+    console.print(f"Connecting to {smtp_server}...")
+    try:
+        server = smtplib.SMTP_SSL(smtp_server, SMTP_SSL_PORT, timeout=SMTP_TIMEOUT)
+        server.login(email_address, password)
+    except (smtplib.SMTPException, OSError) as e:
+        for outcome in outcomes.values():
+            outcome["error"] = str(e) or type(e).__name__
+        return outcomes
+
+    pipelining = server.has_extn("pipelining")
+    jobs = list(jobs)
+    try:
+        with tqdm(total=len(jobs), desc="Sending Unsubscribe Emails", unit="email", file=sys.stdout) as pbar:
+            for index, (sender, url) in enumerate(jobs):
+                if index:
+                    time.sleep(interval)
+                outcome = outcomes[sender]
+                try:
+                    to_address, data = build_mailto_message(email_address, url)
+                    if pipelining:
+                        code, message = send_pipelined(server, email_address, to_address, data)
+                    else:
+                        server.sendmail(email_address, [to_address], data)
+                        code, message = 250, b"OK"
+                except smtplib.SMTPResponseException as e:
+                    code, message = e.smtp_code, e.smtp_error
+                except smtplib.SMTPRecipientsRefused as e:
+                    code, message = next(iter(e.recipients.values()))
+                except (smtplib.SMTPException, OSError, ValueError) as e:
+                    outcome["error"] = str(e) or type(e).__name__
+                    # SMTPException subclasses OSError, only disconnects and socket errors end the session
+                    if isinstance(e, smtplib.SMTPServerDisconnected) or (
+                            isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException)):
+                        for remaining_sender, _ in jobs[index + 1:]:
+                            outcomes[remaining_sender]["error"] = f"Not sent, the SMTP session was lost: {outcome['error']}"
+                        break
+                    continue
+                finally:
+                    pbar.update(1)
+                outcome["code"] = code
+                if code == 250:
+                    outcome["status"] = "ok"
+                else:
+                    outcome["error"] = message.decode(errors="replace")
+    finally:
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+    return outcomes
+
+def unsubscribe_one_click(jobs, workers=ONE_CLICK_WORKERS):
+    """Run RFC 8058 one-click unsubscribe requests without a browser.
+
+    ``jobs`` are (sender address, URL) pairs. Requests are grouped per host, over at
+    most ONE_CLICK_CONNECTIONS_PER_HOST keep-alive connections each, and at most
+    ``workers`` connections are open at a time. Returns the outcome of every
+    sender address.
+    """
+    hosts = {}
+    for email_address, url in jobs:
+        parts = urlsplit(url)
+        hosts.setdefault((parts.scheme, parts.netloc), []).append((email_address, url))
+    groups = [
+        (scheme, netloc, host_jobs[start::ONE_CLICK_CONNECTIONS_PER_HOST])
+        for (scheme, netloc), host_jobs in hosts.items()
+        for start in range(min(ONE_CLICK_CONNECTIONS_PER_HOST, len(host_jobs)))
+    ]
+
+    outcomes = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(groups)))) as executor:
+        for group_outcomes in executor.map(lambda group: run_one_click_requests(*group), groups):
+            outcomes.update(group_outcomes)
+    return outcomes
+
+def parse_email_headers(msg):
+    """Return the decoded subject, sender name and sender address of a message."""
+    subject = decode_header(msg["Subject"])[0][0]
+    subject = subject.decode() if isinstance(subject, bytes) else subject or "No Subject"
+
+    sender = decode_header(msg["From"])[0][0]
+    sender = sender.decode() if isinstance(sender, bytes) else sender
+
+    # Remove email address in angle brackets and unwanted characters from sender name
+    sender = re.sub(r"<.*?>", "", sender).strip()
+    sender = re.sub(r'^"|"$', '', sender).strip()  # Remove leading/trailing quotes
+
+    return subject, sender, extract_sender_email(msg["From"])
+
+def extract_sender_email(from_header):
+    """Extract the email address from a From header."""
+    match = re.search(r"<(.*?)>", from_header)
+    return match.group(1) if match else from_header
+
+class ScanFilter:
+    """Duplicate, skip and history checks of one scan, and the number of emails it still needs."""
+
+    def __init__(self, state, num_emails):
+        self.skipped_emails = state.skipped
+        self.unsubscribed_emails = state.unsubscribed
+        self.unique_titles = set()
+        self.seen_entries = set()  # (sender, links) pairs already fetched
+        self.num_emails = num_emails
+        self.found = 0
+
+    @property
+    def missing(self):
+        return self.num_emails - self.found
+
+    def wants(self, record):
+        """Return whether a record passes the duplicate title, skip and history checks."""
+        if record["subject"] in self.unique_titles:
+            return False  # Skip duplicates
+
+        # Skip emails already marked in the skip or history files
+        return record["email"] not in self.skipped_emails and record["email"] not in self.unsubscribed_emails
+
+    def accept(self, record, handle=None):
+        """Return the result for a record that passes every check and count it, or None."""
+        if not self.missing or record["unsubscribe_links"] is None or not self.wants(record):
+            return None
+        sender = record["sender"]
+        unsubscribe_links = record["unsubscribe_links"]
+
+        # Check if an identical entry (sender + unsubscribe links) exists
+        entry = (sender, frozenset(unsubscribe_links))
+        if entry in self.seen_entries:
+            return None  # Skip if an identical entry already exists
+        self.seen_entries.add(entry)
+
+        self.unique_titles.add(record["subject"])  # Mark this title as processed
+        self.found += 1
+        return ScanResult(record["subject"], sender, record["email"], unsubscribe_links, handle,
+                          record.get("one_click_url"), record.get("mailto_url"))
+
+def read_email(msg, skipped_emails, unsubscribed_emails, require_links=False):
+    """Parse a message into the record kept for it.
+
+    ``unsubscribe_links`` is left as None for senders that are skipped or already
+    unsubscribed. Returns None when ``require_links`` is set and the message
+    yielded no unsubscribe links, so the caller can fetch its body and try again.
+    """
+    subject, sender, sender_email = parse_email_headers(msg)
+    record = {"subject": subject, "sender": sender, "email": sender_email, "unsubscribe_links": None,
+              "body_hash": None, "one_click_url": None, "mailto_url": None}
+    if sender_email in skipped_emails or sender_email in unsubscribed_emails:
+        return record
+
+    # Extract unsubscribe links
+    unsubscribe_links = list(set(extract_unsubscribe_links(msg)))
+    if require_links and not unsubscribe_links:
+        return None
+
+    record["unsubscribe_links"] = unsubscribe_links
+    record["body_hash"] = message_body_hash(msg)
+    record["one_click_url"] = extract_one_click_url(msg)
+    record["mailto_url"] = extract_mailto_url(msg)
+    return record
+
+def message_body_hash(msg):
+    """Return the SHA-256 digest of the HTML parts of a message, or None when it has none (e.g. only headers were fetched)."""
+    digest = None
+    for part in msg.walk():
+        if part.get_content_type() == "text/html":
+            digest = digest or hashlib.sha256()
+            digest.update(part.get_payload(decode=True) or b"")
+    return digest.hexdigest() if digest else None
+
+def read_email_batch(messages, skipped_emails=(), unsubscribed_emails=()):
+    """Parse (UID, raw message) pairs and return (UID, record, error) for each.
+
+    Runs in the parse worker processes, so only raw bytes and small records
+    cross the process boundary. Workers are not given the skip list and history,
+    which can be large; the caller filters the records with ScanFilter anyway.
+    """
+    results = []
+    for email_id, data in messages:
         try:
-            history = json.load(file)
-            console.print(f"[green]Loaded history from {HISTORY_FILE}[/green]")
-            return history
-        except json.JSONDecodeError:
-            console.print(f"[yellow]Failed to load history. Starting with an empty history.[/yellow]")
-            return {}
-
-def save_history(history):
-    """Save the history to the JSON file."""
-    with open(HISTORY_FILE, "w") as file:
-        json.dump(history, file, indent=4)
-    console.print(f"[green]History saved to {HISTORY_FILE}[/green]")
-
-def get_user_history(user_email):
-    """Get the unsubscribed emails for the current user."""
-    history = load_history()
-    return set(history.get(user_email, []))  # Returns a set of unsubscribed emails for the user
-
-def add_to_user_history(user_email, email_to_add):
-    """Add an email to the history for the current user."""
-    history = load_history()
-    if user_email not in history:
-        history[user_email] = []
-    if email_to_add not in history[user_email]:
-        history[user_email].append(email_to_add)
-        save_history(history)
-        console.print(f"[green]{email_to_add} added to the history for {user_email}[/green]")
+            record = read_email(email.message_from_bytes(data), skipped_emails, unsubscribed_emails)
+        except Exception as e:
+            results.append((email_id, None, str(e)))
+        else:
+            results.append((email_id, record, None))
+    return results
+
+def parse_in_workers(parse_pool, messages):
+    """Submit (UID, raw message) pairs to a process pool and return an iterator of (UID, record) in order.
+
+    The batches are submitted right away, so the caller can go on fetching while
+    the workers parse them.
+    """
+    batches = [
+        parse_pool.submit(read_email_batch, messages[start:start + PARSE_BATCH_SIZE])
+        for start in range(0, len(messages), PARSE_BATCH_SIZE)
+    ]
+
+    def parsed():
+        for batch in batches:
+            for email_id, record, error in batch.result():
+                if error is not None:
+                    console.print(f"[red]Error parsing email ID {email_id}: {error}[/red]")
+                else:
+                    yield email_id, record
+    return parsed()
+
+def read_messages(messages, skipped_emails, unsubscribed_emails):
+    """Yield (UID, record) for (UID, message) pairs, reporting the messages that fail to parse."""
+    for email_id, msg in messages:
+        try:
+            yield email_id, read_email(msg, skipped_emails, unsubscribed_emails)
+        except Exception as e:
+            console.print(f"[red]Error parsing email ID {email_id}: {e}[/red]")
+
+def load_sync_state():
+    """Open the SQLite database holding the per-folder UIDVALIDITY/MODSEQ checkpoints and scan results.
+
+    Candidate emails always come from a fresh UID SEARCH, since the criteria can
+    change between runs, so no highest-UID checkpoint is kept.
+    """
+    sync_state = sqlite3.connect(SYNC_FILE)
+    sync_state.executescript("""
+        CREATE TABLE IF NOT EXISTS folders (
+            account TEXT, folder TEXT, uidvalidity INTEGER, highestmodseq INTEGER,
+            PRIMARY KEY (account, folder)
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            account TEXT, folder TEXT, uidvalidity INTEGER, uid INTEGER,
+            subject TEXT, sender TEXT, email TEXT, unsubscribe_links TEXT, body_hash TEXT, one_click_url TEXT,
+            mailto_url TEXT,
+            PRIMARY KEY (account, folder, uidvalidity, uid)
+        ) WITHOUT ROWID;
+    """)
+    columns = {row[1] for row in sync_state.execute("PRAGMA table_info(messages)")}
+    for column in ("one_click_url", "mailto_url"):
+        if column not in columns:  # Caches written before the column was added
+            sync_state.execute(f"ALTER TABLE messages ADD COLUMN {column} TEXT")
+    if "last_uid" in {row[1] for row in sync_state.execute("PRAGMA table_info(folders)")}:
+        try:
+            sync_state.execute("ALTER TABLE folders DROP COLUMN last_uid")  # Written by older versions, never read
+        except sqlite3.OperationalError:
+            pass  # SQLite before 3.35 cannot drop columns, the inserts below name their columns
+    return sync_state
+
+def get_folder_state(sync_state, account, folder):
+    """Return the UIDVALIDITY and HIGHESTMODSEQ checkpoints of a folder, or None when it was never scanned."""
+    row = sync_state.execute("SELECT uidvalidity, highestmodseq FROM folders WHERE account = ? AND folder = ?",
+                             (account, folder)).fetchone()
+    return {"uidvalidity": row[0], "highestmodseq": row[1]} if row else None
+
+def get_folder_results(sync_state, account, folder, uidvalidity):
+    """Return the cached scan results of a folder, keyed by UID.
+
+    The cache is dropped when the folder's UIDVALIDITY changed, as its UIDs then
+    refer to different messages.
+    """
+    folder_state = get_folder_state(sync_state, account, folder)
+    if not folder_state or folder_state["uidvalidity"] != uidvalidity:
+        if folder_state:
+            console.print(f"[yellow]UIDVALIDITY of {folder} changed, discarding its cached results.[/yellow]")
+        return {}
+
+    rows = sync_state.execute(
+        "SELECT uid, subject, sender, email, unsubscribe_links, body_hash, one_click_url, mailto_url FROM messages "
+        "WHERE account = ? AND folder = ? AND uidvalidity = ?", (account, folder, uidvalidity))
+    return {
+        uid: {
+            "subject": subject,
+            "sender": sender,
+            "email": email_address,
+            "unsubscribe_links": json.loads(links) if links is not None else None,
+            "body_hash": body_hash,
+            "one_click_url": one_click_url,
+            "mailto_url": mailto_url,
+        }
+        for uid, subject, sender, email_address, links, body_hash, one_click_url, mailto_url in rows
+    }
+
+def update_folder_results(sync_state, account, folder, uidvalidity, highestmodseq, results, scanned_uids):
+    """Store the UIDVALIDITY/MODSEQ checkpoints of a folder and the results of the emails scanned this run.
+
+    Cached rows of emails no longer in ``results`` (deleted, or from an older
+    UIDVALIDITY) are removed.
+    """
+    with sync_state:  # One transaction
+        sync_state.execute("INSERT OR REPLACE INTO folders (account, folder, uidvalidity, highestmodseq) "
+                           "VALUES (?, ?, ?, ?)", (account, folder, uidvalidity, highestmodseq))
+        sync_state.execute("DELETE FROM messages WHERE account = ? AND folder = ? AND uidvalidity != ?",
+                           (account, folder, uidvalidity))
+        cached_uids = {uid for uid, in sync_state.execute(
+            "SELECT uid FROM messages WHERE account = ? AND folder = ?", (account, folder))}
+        sync_state.executemany("DELETE FROM messages WHERE account = ? AND folder = ? AND uid = ?",
+                               [(account, folder, uid) for uid in cached_uids - set(results)])
+        sync_state.executemany(
+            "INSERT OR REPLACE INTO messages (account, folder, uidvalidity, uid, subject, sender, email, "
+            "unsubscribe_links, body_hash, one_click_url, mailto_url) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (account, folder, uidvalidity, uid, record["subject"], record["sender"], record["email"],
+                 json.dumps(record["unsubscribe_links"]) if record["unsubscribe_links"] is not None else None,
+                 record.get("body_hash"), record.get("one_click_url"), record.get("mailto_url"))
+                for uid, record in ((uid, results[uid]) for uid in scanned_uids if uid in results)
+            ],
+        )
+
+def server_capabilities(mail):
+    """Return the capabilities the server advertises once logged in."""
+    status, data = mail.capability()
+    if status == "OK" and data and data[0]:
+        mail.capabilities = tuple(data[0].decode().upper().split())
+    return mail.capabilities
+
+def select_folder(mail, folder, readonly=False, select_params=None):
+    """Select a folder and return its UIDVALIDITY and HIGHESTMODSEQ (None when not reported)."""
+    mailbox = quote_imap_string(folder)
+    if select_params:
+        mailbox += f" ({select_params})"  # imaplib sends the mailbox argument as-is
+    status, _ = mail.select(mailbox, readonly=readonly)
+    if status != "OK":
+        raise imaplib.IMAP4.error(f"Cannot select folder {folder}")
+
+    _, uidvalidity = mail.response("UIDVALIDITY")
+    _, highestmodseq = mail.response("HIGHESTMODSEQ")
+    return (
+        int(uidvalidity[0]) if uidvalidity and uidvalidity[0] else None,
+        int(highestmodseq[0]) if highestmodseq and highestmodseq[0] else None,
+    )
+
+def expand_sequence_set(sequence_set):
+    """Expand an IMAP sequence set such as 41,43:116 into a set of numbers."""
+    numbers = set()
+    for piece in sequence_set.split(","):
+        start, _, end = piece.partition(":")
+        if start.isdigit() and (not end or end.isdigit()):
+            start, end = sorted((int(start), int(end or start)))
+            numbers.update(range(start, end + 1))
+    return numbers
+
+def deleted_uids(fetch_data):
+    """Return the UIDs flagged \\Deleted in FETCH responses carrying FLAGS."""
+    uids = set()
+    for _, attributes in iter_fetch_responses(fetch_data):
+        flags = attributes.get("FLAGS")
+        uid = attributes.get("UID")
+        if isinstance(flags, list) and b"\\Deleted" in flags and isinstance(uid, bytes) and uid.isdigit():
+            uids.add(int(uid))
+    return uids
+
+def split_sequence_set(ids, limit=CLEANUP_SET_LIMIT):
+    """Yield compact IMAP sequence sets covering ids, each at most limit characters long."""
+    if not ids:
+        return
+    chunk = ""
+    for piece in compact_sequence_set(ids).split(","):
+        if chunk and len(chunk) + 1 + len(piece) > limit:
+            yield chunk
+            chunk = piece
+        else:
+            chunk = f"{chunk},{piece}" if chunk else piece
+    yield chunk
+
+def find_trash_folder(mail):
+    """Return the folder the server marks as the trash (RFC 6154 \\Trash), or None."""
+    status, folders = mail.list()
+    if status != "OK":
+        return None
+    for line in folders or []:
+        if not isinstance(line, bytes):
+            continue  # Folder names sent as literals are not worth handling here
+        response = parse_imap_response([line])
+        if len(response) == 3 and isinstance(response[0], list) and isinstance(response[2], bytes):
+            if b"\\trash" in (flag.lower() for flag in response[0]):
+                return response[2].decode()
+    return None
+
+def search_sender_uids(mail, sender):
+    """Return the UIDs of the messages sent from sender in the selected folder.
+
+    SEARCH FROM matches substrings, so the From header of each match is fetched to
+    keep only the messages sent from exactly that address.
+    """
+    status, data = mail.uid("SEARCH", None, f"FROM {quote_imap_string(sender)}")
+    if status != "OK" or not data or not data[0]:
+        return []
+    uids = [int(uid) for uid in data[0].split()]
+    matches = []
+    for start in range(0, len(uids), FETCH_BATCH_SIZE):
+        for uid, msg in fetch_messages(mail, uids[start:start + FETCH_BATCH_SIZE], SENDER_QUERY, "BODY[HEADER"):
+            if extract_sender_email(msg["From"] or "").strip().lower() == sender.lower():
+                matches.append(uid)
+    return matches
+
+def clean_senders(mail, senders, folder=DEFAULT_FOLDER):
+    """Remove every message from senders in folder and return {sender: messages removed}.
+
+    Messages are moved to the trash with UID MOVE when the server supports it,
+    otherwise they are flagged \\Deleted and expunged with UID EXPUNGE. Servers
+    without UIDPLUS can only expunge every deleted message in the folder, so
+    there the messages are left flagged for the user's mail client to expunge.
+    UIDs are sent in sequence sets short enough for the server to accept.
+    """
+    started = time.perf_counter()
+    capabilities = server_capabilities(mail)
+    trash = find_trash_folder(mail) if "MOVE" in capabilities else None
+    if trash and trash.lower() == folder.lower():
+        trash = None  # Cleaning the trash itself deletes the messages for good
+    expunge = "UIDPLUS" in capabilities
+    action = "Moved" if trash else "Deleted" if expunge else "Flagged as deleted"
+    select_folder(mail, folder)
+
+    removed = {}
+    for sender in senders:
+        removed[sender] = 0
+        for sequence_set in split_sequence_set(search_sender_uids(mail, sender)):
+            if trash:
+                status, _ = mail.uid("MOVE", sequence_set, quote_imap_string(trash))
+            else:
+                status, _ = mail.uid("STORE", sequence_set, "+FLAGS.SILENT", "(\\Deleted)")
+                if status == "OK" and expunge:
+                    status, _ = mail.uid("EXPUNGE", sequence_set)  # Leaves other deleted messages alone
+            if status != "OK":
+                console.print(f"[red]Error removing messages {sequence_set} from {sender}[/red]")
+                continue
+            removed[sender] += len(expand_sequence_set(sequence_set))
+        console.print(f"[green]{action} {removed[sender]} messages from {sender}"
+                      f"{' to ' + trash if trash else ''}.[/green]")
+
+    total = sum(removed.values())
+    elapsed = time.perf_counter() - started
+    if not trash and not expunge and total:
+        console.print(f"[yellow]The server cannot expunge single messages (no UIDPLUS), so the messages are "
+                      f"only flagged as deleted in {folder}. Expunge the folder from your mail client to remove "
+                      f"them.[/yellow]")
+    console.print(f"[green]{action} {total} messages from {len(senders)} senders in {elapsed:.1f}s "
+                  f"({total / elapsed if elapsed else 0:.0f} messages/s).[/green]")
+    return removed
+
+def open_folder(mail, folder, sync_state, account=None, readonly=False):
+    """Select a folder and return its UIDVALIDITY, HIGHESTMODSEQ and cached results.
+
+    Cached results are brought in line with the emails deleted since the last run:
+    through the VANISHED and FETCH responses of a QRESYNC select, CHANGEDSINCE flag
+    updates on CONDSTORE servers, or a plain UID diff on any other server.
+    """
+    folder_state = get_folder_state(sync_state, account, folder) if account else None
+    capabilities = server_capabilities(mail)
+    cached_modseq = folder_state.get("highestmodseq") if folder_state else None
+
+    select_params = None
+    qresync = bool(cached_modseq and "QRESYNC" in capabilities)
+    if qresync:
+        mail.enable("QRESYNC")
+        cached_uids = [uid for uid, in sync_state.execute(
+            "SELECT uid FROM messages WHERE account = ? AND folder = ? AND uidvalidity = ?",
+            (account, folder, folder_state["uidvalidity"]))]
+        known_uids = compact_sequence_set(cached_uids) if cached_uids else ""
+        if len(known_uids) > QRESYNC_KNOWN_UIDS_LIMIT:
+            known_uids = ""  # The server can work out what vanished without the list
+        select_params = f"QRESYNC ({folder_state['uidvalidity']} {cached_modseq}{' ' + known_uids if known_uids else ''})"
+    elif "CONDSTORE" in capabilities:
+        select_params = "CONDSTORE"
+
+    uidvalidity, highestmodseq = select_folder(mail, folder, readonly, select_params)
+    if not account or not uidvalidity:
+        return uidvalidity, highestmodseq, {}
+    results = get_folder_results(sync_state, account, folder, uidvalidity)
+    if not results or (cached_modseq and cached_modseq == highestmodseq):
+        return uidvalidity, highestmodseq, results  # Nothing changed since the last run
+
+    if qresync:
+        _, vanished = mail.response("VANISHED")
+        _, fetch_data = mail.response("FETCH")
+        removed = deleted_uids(fetch_data or [])
+        for response in vanished or []:
+            if response:
+                removed |= expand_sequence_set(response.decode().split()[-1])
+    else:
+        removed = set()
+        if cached_modseq and highestmodseq:
+            status, fetch_data = mail.uid("FETCH", f"1:{max(results)}", f"(UID FLAGS) (CHANGEDSINCE {cached_modseq})")
+            if status == "OK":
+                removed |= deleted_uids(fetch_data)
+
+        # Expunged emails only show up by comparing the UIDs still on the server
+        status, messages = mail.uid("SEARCH", None, f"UID 1:{max(results)}")
+        if status == "OK":
+            removed |= set(results) - set(int(uid) for uid in messages[0].split())
+
+    removed &= set(results)
+    for uid in removed:
+        del results[uid]
+    if removed:
+        console.print(f"[blue]Dropped {len(removed)} deleted emails from the cache of {folder}.[/blue]")
+    return uidvalidity, highestmodseq, results
+
+def fetch_attributes(mail, email_ids, query):
+    """Run a single UID FETCH command over email_ids and yield (UID, response attributes)."""
+    sequence_set = compact_sequence_set(email_ids)
+    status, msg_data = mail.uid("FETCH", sequence_set, query)
+    if status != "OK":
+        console.print(f"[red]Error fetching emails {sequence_set}[/red]")
+        return
+
+    for _, attributes in iter_fetch_responses(msg_data):
+        uid = attributes.get("UID")
+        if isinstance(uid, bytes) and uid.isdigit():  # Unsolicited updates may lack a UID
+            yield int(uid), attributes
+
+def fetch_message_data(mail, email_ids, query=FULL_MESSAGE_QUERY, item=FULL_MESSAGE_ITEM):
+    """Fetch email_ids with a single FETCH command and yield (email ID, raw message).
+
+    ``item`` is the (prefix of the) response attribute holding the message data.
+    """
+    for email_id, attributes in fetch_attributes(mail, email_ids, query):
+        data = next((value for name, value in attributes.items() if name.startswith(item)), None)
+        if isinstance(data, bytes):  # Unsolicited FLAGS updates carry no message
+            yield email_id, data
+
+def fetch_messages(mail, email_ids, query=FULL_MESSAGE_QUERY, item=FULL_MESSAGE_ITEM):
+    """Fetch email_ids with a single FETCH command and yield (email ID, parsed message)."""
+    for email_id, data in fetch_message_data(mail, email_ids, query, item):
+        yield email_id, email.message_from_bytes(data)
+
+def find_html_part(structure, section=""):
+    """Locate the first text/html part in a parsed BODYSTRUCTURE.
+
+    Returns a dict with the part's section number, charset, transfer encoding and
+    size, or None when the message has no HTML part.
+    """
+    if not isinstance(structure, list) or not structure:
+        return None
+
+    if isinstance(structure[0], list):
+        # Multipart: the child parts come first, followed by the subtype
+        for number, child in enumerate(item for item in structure if isinstance(item, list)):
+            html_part = find_html_part(child, f"{section}.{number + 1}" if section else str(number + 1))
+            if html_part:
+                return html_part
+        return None
+
+    if len(structure) < 7 or not all(isinstance(value, bytes) for value in structure[:2]):
+        return None
+    if (structure[0] + b"/" + structure[1]).lower() != b"text/html":
+        return None
+
+    params = structure[2] if isinstance(structure[2], list) else []
+    params = {name.lower(): value for name, value in zip(params[::2], params[1::2]) if isinstance(name, bytes)}
+    return {
+        "section": section or "1",
+        "charset": (params.get(b"charset") or b"utf-8").decode(errors="ignore"),
+        "encoding": (structure[5] or b"7bit").decode(errors="ignore"),
+        "size": int(structure[6]) if structure[6] and structure[6].isdigit() else 0,
+    }
+
+def build_part_message(header_msg, html_part, data):
+    """Combine previously fetched headers with a single fetched HTML part."""
+    msg = email.message_from_bytes(
+        f'Content-Type: text/html; charset="{html_part["charset"]}"\r\n'
+        f'Content-Transfer-Encoding: {html_part["encoding"]}\r\n\r\n'.encode() + data
+    )
+    for header, value in header_msg.items():
+        msg[header] = value
+    return msg
+
+def trim_encoded_tail(data, encoding):
+    """Cut a partially fetched tail of an encoded part back to something decodable."""
+    encoding = encoding.lower()
+    if encoding not in ("base64", "quoted-printable"):
+        return data
+
+    # Drop the partial first line, it may start inside a base64 quantum or a =XX escape
+    data = data.partition(b"\n")[2]
+    if encoding == "base64":
+        data = b"".join(data.split())
+        data = data[len(data) % 4:]  # The tail ends on a full quantum, so align its start
+    return data
+
+def fetch_html_parts(mail, header_msgs, tail_size=None):
+    """Yield (email ID, message) with only the text/html part of each message downloaded.
+
+    ``header_msgs`` maps email IDs to the messages holding their already fetched
+    headers. BODYSTRUCTURE is used to locate the HTML part, so attachments are
+    never transferred. With ``tail_size`` only the end of the part is fetched
+    first, falling back to the full part when the tail holds no unsubscribe link.
+    Tails start at a multiple of ``tail_size`` and run for twice that, so parts
+    of similar sizes share one FETCH while each still gets its last ``tail_size``
+    bytes.
+    """
+    sections = {}
+    for email_id, attributes in fetch_attributes(mail, list(header_msgs), "(BODYSTRUCTURE)"):
+        if email_id not in header_msgs:
+            continue
+        html_part = find_html_part(attributes.get("BODYSTRUCTURE"))
+        if html_part:
+            sections.setdefault(html_part["section"], {})[email_id] = html_part
+        else:
+            yield email_id, header_msgs[email_id]  # Nothing beyond the headers to look at
+
+    # One FETCH per distinct section number, usually just "1" and "1.2"
+    for section, html_parts in sections.items():
+        full_parts = dict(html_parts)
+
+        if tail_size:
+            # Partial fetches share a FETCH only when they start at the same offset
+            tails = {}
+            for email_id, html_part in html_parts.items():
+                if html_part["size"] > tail_size:
+                    offset = (html_part["size"] - tail_size) // tail_size * tail_size
+                    tails.setdefault(offset, []).append(email_id)
+
+            for offset, email_ids in tails.items():
+                query = f"(BODY.PEEK[{section}]<{offset}.{2 * tail_size}>)"
+                for email_id, attributes in fetch_attributes(mail, email_ids, query):
+                    data = attributes.get(f"BODY[{section}]<{offset}>")
+                    if email_id not in full_parts or not isinstance(data, bytes):
+                        continue
+                    html_part = full_parts[email_id]
+                    msg = build_part_message(header_msgs[email_id], html_part,
+                                             trim_encoded_tail(data, html_part["encoding"]))
+                    if extract_unsubscribe_links(msg):
+                        del full_parts[email_id]
+                        yield email_id, msg
+
+        if full_parts:
+            for email_id, attributes in fetch_attributes(mail, list(full_parts), f"(BODY.PEEK[{section}])"):
+                data = attributes.get(f"BODY[{section}]")
+                if email_id in full_parts and isinstance(data, bytes):
+                    yield email_id, build_part_message(header_msgs[email_id], full_parts[email_id], data)
+
+def discover_senders(mail, email_ids, skipped_emails, unsubscribed_emails, results=None):
+    """Return the newest email ID of every distinct sender, oldest first.
+
+    Only the From header of each message is swept, in a few large FETCH commands.
+    Emails with cached ``results`` are not fetched again. Senders that are skipped
+    or already in the history are left out.
+    """
+    results = results or {}
+    newest = {}
+
+    def add_sender(email_id, sender_email):
+        if sender_email not in skipped_emails and sender_email not in unsubscribed_emails:
+            key = sender_email.lower()
+            newest[key] = max(newest.get(key, 0), email_id)
+
+    uncached_ids = []
+    for email_id in email_ids:
+        if email_id in results:
+            add_sender(email_id, results[email_id]["email"])
+        else:
+            uncached_ids.append(email_id)
+
+    with tqdm(total=len(uncached_ids), desc="Scanning Senders", unit="email", file=sys.stdout) as pbar:
+        for start in range(0, len(uncached_ids), SENDER_SWEEP_BATCH_SIZE):
+            chunk_ids = uncached_ids[start:start + SENDER_SWEEP_BATCH_SIZE]
+            try:
+                for email_id, msg in fetch_messages(mail, chunk_ids, SENDER_QUERY, "BODY[HEADER"):
+                    if msg["From"]:
+                        add_sender(email_id, extract_sender_email(msg["From"]).strip())
+            except Exception as e:
+                console.print(f"[red]Error fetching emails {compact_sequence_set(chunk_ids)}: {e}[/red]")
+            pbar.update(len(chunk_ids))
+
+    console.print(f"[blue]Found {len(newest)} distinct senders in {len(email_ids)} emails.[/blue]")
+    return sorted(newest.values())
+
+def read_emails(mail, email_ids, skipped_emails, unsubscribed_emails, headers_first=False, body_mode="full",
+                tail_size=TAIL_FETCH_SIZE, parse_pool=None):
+    """Fetch email_ids and return an iterator of (UID, record) for each email read.
+
+    Everything is downloaded before returning and only parsing is left to the
+    iterator, so the session is free for the next chunk while it is consumed.
+    With ``headers_first`` only the headers needed for the table are fetched, and the
+    body is downloaded only when the headers hold no unsubscribe link. ``body_mode``
+    "html" downloads just the text/html part of those bodies instead of the whole
+    message, and "tail" only its last ``tail_size`` bytes where unsubscribe footers
+    live. Both imply ``headers_first``. Whole messages are parsed over
+    ``parse_pool`` when one is given.
+    """
+    headers_first = headers_first or body_mode != "full"
+    header_msgs = dict.fromkeys(email_ids)
+    header_records = []
+    if headers_first:
+        # Phase one: headers only, keep the messages that need a body
+        header_msgs = {}
+        for email_id, msg in fetch_messages(mail, email_ids, HEADER_QUERY, "BODY[HEADER"):
+            try:
+                record = read_email(msg, skipped_emails, unsubscribed_emails, require_links=True)
+            except Exception as e:
+                console.print(f"[red]Error parsing email ID {email_id}: {e}[/red]")
+                continue
+            if record is None:
+                header_msgs[email_id] = msg
+            else:
+                header_records.append((email_id, record))
+
+    if not header_msgs:
+        return iter(header_records)
+    if body_mode in ("html", "tail"):
+        body_messages = list(fetch_html_parts(mail, header_msgs, tail_size if body_mode == "tail" else None))
+    elif parse_pool is not None:
+        messages = list(fetch_message_data(mail, list(header_msgs)))
+        return chain(header_records, parse_in_workers(parse_pool, messages))
     else:
-        console.print(f"[yellow]{email_to_add} is already in the history for {user_email}[/yellow]")
+        messages = list(fetch_message_data(mail, list(header_msgs)))
+        body_messages = ((email_id, email.message_from_bytes(data)) for email_id, data in messages)
+    return chain(header_records, read_messages(body_messages, skipped_emails, unsubscribed_emails))
+
+def read_chunks(sessions, chunks, reader, replay=None):
+    """Yield what reader returns for the emails of every chunk, in chunk order, as they are read.
 
-def fetch_emails(mail, num_emails):
-    """Fetch emails and ensure unique titles and links, skipping previously saved emails."""
-    mail.select("inbox")
+    ``reader(mail, email_ids)`` downloads one chunk over one IMAP session and returns
+    an iterator that parses it. Chunks are spread over one worker thread per
+    session, so the next chunks download while the current one is parsed and
+    consumed, even with a single session. ``replay(email_ids)`` optionally returns
+    the items of a chunk already known without the server, such as cached results,
+    and the email IDs left to read; a chunk with nothing left to read is handed on
+    before any further chunk is requested.
+    """
+    idle_sessions = queue.Queue()
+    for session in sessions:
+        idle_sessions.put(session)
+
+    def read_chunk(items, chunk_ids):
+        session = idle_sessions.get()  # Each session serves one worker at a time
+        try:
+            return chain(items, reader(session, chunk_ids))
+        except Exception as e:
+            console.print(f"[red]Error fetching emails {compact_sequence_set(chunk_ids)}: {e}[/red]")
+            return iter(items)
+        finally:
+            idle_sessions.put(session)
 
-    # Search for all emails
-    status, messages = mail.search(None, "ALL")
+    # Read at most two chunks ahead per session, so unconsumed results stay bounded
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=len(sessions)) as executor:
+        try:
+            for chunk_ids in chunks:
+                items, chunk_ids = replay(chunk_ids) if replay else ((), chunk_ids)
+                if chunk_ids:
+                    pending.append((executor.submit(read_chunk, items, chunk_ids), True))
+                else:
+                    replayed = Future()
+                    replayed.set_result(iter(items))
+                    pending.append((replayed, False))
+                # Nothing is read ahead of a replayed chunk, which may be all the consumer needs
+                while pending and (not pending[0][1] or len(pending) >= 2 * len(sessions)):
+                    yield from pending.popleft()[0].result()
+            while pending:
+                yield from pending.popleft()[0].result()
+        finally:
+            for future, _ in pending:
+                future.cancel()  # The consumer stopped early
+
+def newest_first_chunks(email_ids, batch_size):
+    """Yield chunks of at most batch_size UIDs over email_ids, starting with the latest emails."""
+    for end in range(len(email_ids), 0, -batch_size):
+        yield email_ids[max(end - batch_size, 0):end]
+
+def iter_emails(mail, num_emails, batch_size=FETCH_BATCH_SIZE, headers_first=False, body_mode="full",
+                tail_size=TAIL_FETCH_SIZE, by_sender=False, search_criteria="ALL", account=None,
+                folder=DEFAULT_FOLDER, sessions=None, use_cache=True, parse_pool=None, state=None):
+    """Yield up to num_emails emails with unique titles and links as they are found, skipping previously saved emails.
+
+    Messages are requested by UID ``batch_size`` at a time, latest first, one FETCH
+    command per sequence set, and fetching stops as soon as enough emails were
+    found. When an
+    ``account`` is given and ``use_cache`` is set, the parsed results are cached per
+    folder in the sync state, so later runs only download emails they have not seen
+    before. Results carry a MessageHandle instead of the message itself, so memory
+    does not grow with the size of the scan. ``headers_first``, ``body_mode`` and
+    ``tail_size`` control how much of each email is downloaded (see read_emails).
+    With ``by_sender`` the From headers of the whole mailbox are swept first and
+    only the newest email of each sender is read. ``search_criteria`` lets the
+    server pre-filter the candidate emails. ``sessions`` are extra logged-in
+    connections with the folder selected that read chunks in parallel with ``mail``.
+    ``state`` is the SessionState whose history and skip list are left out, loaded
+    for ``account`` when not given.
+    """
+    caching = bool(account and use_cache)
+    sync_state = load_sync_state() if caching else None
+    uidvalidity, highestmodseq, results = open_folder(mail, folder, sync_state, account if caching else None)
+    caching = caching and bool(uidvalidity)
+    scanned_uids = []  # Emails read from the server this run, for the cache
+
+    if "X-GM-RAW" in search_criteria and "X-GM-EXT-1" not in mail.capabilities:
+        console.print("[yellow]The server does not support Gmail search queries (X-GM-RAW).[/yellow]")
+
+    # Let the server pick the candidate emails
+    status, messages = mail.uid("SEARCH", None, search_criteria)
     if status != "OK":
         console.print("[red]Failed to fetch emails.[/red]")
-        return []
+        return
 
-    email_ids = messages[0].split()
+    email_ids = [int(uid) for uid in messages[0].split()]
+    state = state or SessionState(account)
+    scan = ScanFilter(state, num_emails)
+    skipped_emails = state.skipped
+    unsubscribed_emails = state.unsubscribed
+    if results:
+        unseen_emails = sum(1 for uid in email_ids if uid not in results)
+        console.print(f"[blue]{len(email_ids) - unseen_emails} emails cached from earlier runs, "
+                      f"{unseen_emails} not scanned yet.[/blue]")
+    if by_sender and email_ids:
+        email_ids = discover_senders(mail, email_ids, skipped_emails, unsubscribed_emails, results)
     total_emails = len(email_ids)
-    fetched_emails = []
-    unique_titles = set()
-    skipped_emails = load_skipped_emails()
-    unsubscribed_emails = load_history()
-    emails_to_fetch = num_emails
-    offset = 0  # Start fetching from the latest emails
-
-    while len(fetched_emails) < num_emails and offset < total_emails:
-        batch_size = min(emails_to_fetch, total_emails - offset)
-        email_batch_ids = email_ids[-(offset + batch_size): -offset or None]  # Fetch in batches
-        offset += batch_size
-
-        console.print(f"[blue]Fetching a batch of {batch_size} emails...[/blue]")
-        with tqdm(total=batch_size, desc="Fetching Emails", unit="email", file=sys.stdout) as pbar:
-            for email_id in email_batch_ids:
-                try:
-                    status, msg_data = mail.fetch(email_id, "(RFC822)")
+    fetch_chunk = partial(read_emails, skipped_emails=skipped_emails, unsubscribed_emails=unsubscribed_emails,
+                          headers_first=headers_first, body_mode=body_mode, tail_size=tail_size,
+                          parse_pool=parse_pool)
+
+    def replay(chunk_ids):
+        """Replay the results cached by earlier runs and leave only the rest of the chunk to read."""
+        cached, uncached_ids = [], []
+        for email_id in chunk_ids:
+            record = results.get(email_id)
+            if record is None or (record["unsubscribe_links"] is None
+                                  and record["email"] not in skipped_emails
+                                  and record["email"] not in unsubscribed_emails):
+                uncached_ids.append(email_id)  # Never scanned, or its links were never extracted
+            else:
+                cached.append((email_id, record, False))
+        return cached, uncached_ids
+
+    def reader(session, chunk_ids):
+        return ((email_id, record, True) for email_id, record in fetch_chunk(session, chunk_ids))
+
+    # Chunks are read lazily, so fetching stops soon after enough emails were found
+    console.print(f"[blue]Fetching up to {total_emails} emails, {batch_size} per request...[/blue]")
+    chunks = newest_first_chunks(email_ids, batch_size)
+    try:
+        with tqdm(total=total_emails, desc="Fetching Emails", unit="email", file=sys.stdout) as pbar:
+            for email_id, record, fetched in read_chunks([mail] + list(sessions or []), chunks, reader, replay):
+                if fetched:
+                    results[email_id] = record
+                    scanned_uids.append(email_id)
+                pbar.update(1)
+                result = scan.accept(record, MessageHandle(account, folder, uidvalidity, email_id))
+                if result is not None:
+                    yield result
+                    if not scan.missing:
+                        return
+    finally:
+        if caching:
+            update_folder_results(sync_state, account, folder, uidvalidity, highestmodseq, results, scanned_uids)
+        if sync_state is not None:
+            sync_state.close()
+
+def fetch_emails(mail, num_emails, **options):
+    """Fetch emails with iter_emails, showing them as they are found, and return them sorted by sender."""
+    fetched_emails = [show_found_email(email) for email in iter_emails(mail, num_emails, **options)]
+
+    # Sort emails alphabetically by sender
+    fetched_emails.sort(key=attrgetter("sender"))
+    return fetched_emails
+
+class AsyncIMAPClient:
+    """Minimal asyncio IMAP client that keeps several tagged commands in flight.
+
+    Responses are read by a background task that parses literals straight from the
+    stream. FETCH responses are queued as they arrive and handed out by fetch(),
+    everything else is collected per response type for the command waiting on it.
+    """
+
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self.tag_count = 0
+        self.pending = {}  # Tag -> future resolved with the command's (status, text)
+        self.untagged = {}  # Response type -> untagged responses that are not FETCH
+        self.fetches = asyncio.Queue()
+        self.read_task = None
+
+    async def connect(self, host, port=IMAP_SSL_PORT, use_ssl=True):
+        """Open the connection and start reading responses."""
+        self.reader, self.writer = await asyncio.open_connection(
+            host, port, ssl=ssl.create_default_context() if use_ssl else None, limit=2 ** 24
+        )
+        await self.read_response()  # Server greeting
+        self.read_task = asyncio.create_task(self.read_responses())
+
+    async def read_response(self):
+        """Read one response as segments alternating text and literal data."""
+        segments = []
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise ConnectionError("Connection closed by the server")
+            match = re.search(rb"\{(\d+)\}\r?\n$", line)
+            segments.append(line.rstrip(b"\r\n"))
+            if not match:
+                return segments
+            segments.append(await self.reader.readexactly(int(match.group(1))))
+
+    async def read_responses(self):
+        """Dispatch responses to the commands and fetches waiting on them."""
+        try:
+            while True:
+                segments = await self.read_response()
+                head = segments[0]
+                if head.startswith(b"* "):
+                    tokens = parse_imap_response(segments)
+                    if len(tokens) > 3 and tokens[2] == b"FETCH" and isinstance(tokens[3], list):
+                        attributes = fetch_response_attributes(tokens[3])
+                        uid = attributes.get("UID")
+                        if isinstance(uid, bytes) and uid.isdigit():
+                            self.fetches.put_nowait((int(uid), attributes))
+                    elif len(tokens) > 1 and isinstance(tokens[1], bytes):
+                        self.untagged.setdefault(tokens[1].decode().upper(), []).append(head[2:])
+                elif not head.startswith(b"+"):
+                    tag, _, rest = head.decode(errors="replace").partition(" ")
+                    status, _, text = rest.partition(" ")
+                    future = self.pending.pop(tag, None)
+                    if future and not future.done():
+                        future.set_result((status.upper(), text))
+        except Exception as e:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f"Connection lost: {e}"))
+            self.pending.clear()
+
+    async def send(self, command):
+        """Send a tagged command and return the future resolved on its completion."""
+        if self.read_task is not None and self.read_task.done():
+            raise ConnectionError("Connection closed by the server")  # Nothing would resolve the future
+        self.tag_count += 1
+        tag = f"A{self.tag_count:04d}"
+        future = asyncio.get_running_loop().create_future()
+        self.pending[tag] = future
+        self.writer.write(f"{tag} {command}\r\n".encode())
+        await self.writer.drain()
+        return future
+
+    async def execute(self, command):
+        """Run a command to completion, raising imaplib.IMAP4.error unless it succeeds."""
+        try:
+            status, text = await asyncio.wait_for(await self.send(command), IMAP_COMMAND_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise ConnectionError(f"{command.split()[0]} timed out") from None
+        if status != "OK":
+            raise imaplib.IMAP4.error(f"{command.split()[0]} failed: {text}")
+        return text
+
+    async def login(self, user, password):
+        await self.execute(f"LOGIN {quote_imap_string(user)} {quote_imap_string(password)}")
+
+    async def select(self, folder, readonly=True):
+        """Select a folder and return its UIDVALIDITY, or None when the server does not report it."""
+        self.untagged.pop("OK", None)
+        await self.execute(f"{'EXAMINE' if readonly else 'SELECT'} {quote_imap_string(folder)}")
+        for response in self.untagged.pop("OK", []):
+            match = re.search(rb"\[UIDVALIDITY (\d+)\]", response)
+            if match:
+                return int(match.group(1))
+        return None
+
+    async def uid_search(self, criteria):
+        """Return the UIDs matching the search criteria."""
+        self.untagged.pop("SEARCH", None)
+        await self.execute(f"UID SEARCH {criteria}")
+        return [int(uid) for response in self.untagged.pop("SEARCH", []) for uid in response.split()[1:]]
+
+    async def fetch(self, chunks, query, pipeline_depth=PIPELINE_DEPTH):
+        """Yield (UID, attributes) for the emails of every chunk as the responses arrive.
+
+        Each chunk is one UID FETCH command, and up to ``pipeline_depth`` of them are
+        kept in flight on the connection. Chunks are taken lazily from any iterable.
+        """
+        chunks = iter(chunks)
+        futures = []
+        in_flight = 0
+        more_chunks = True
+        try:
+            while more_chunks or in_flight:
+                while more_chunks and in_flight < pipeline_depth:
+                    chunk_ids = next(chunks, None)
+                    if chunk_ids is None:
+                        more_chunks = False
+                        break
+                    future = await self.send(f"UID FETCH {compact_sequence_set(chunk_ids)} {query}")
+                    # The tagged completion follows all of the command's FETCH responses
+                    future.add_done_callback(lambda done: self.fetches.put_nowait((None, done)))
+                    futures.append(future)
+                    in_flight += 1
+
+                uid, attributes = await self.fetches.get()
+                if uid is None:
+                    in_flight -= 1
+                    if attributes.exception():
+                        raise attributes.exception()
+                    status, text = attributes.result()
                     if status != "OK":
-                        console.print(f"[red]Error fetching email ID {email_id.decode()}[/red]")
-                        continue
+                        console.print(f"[red]Error fetching emails: {text}[/red]")
+                    continue
+                yield uid, attributes
+        finally:
+            # Retrieve the errors of commands still in flight, so none goes unreported
+            for future in futures:
+                if future.done() and not future.cancelled():
+                    future.exception()
+                else:
+                    future.cancel()
 
-                    for response_part in msg_data:
-                        if isinstance(response_part, tuple):
-                            msg = email.message_from_bytes(response_part[1])
-                            subject = decode_header(msg["Subject"])[0][0]
-                            subject = subject.decode() if isinstance(subject, bytes) else subject or "No Subject"
-
-                            if subject in unique_titles:
-                                continue  # Skip duplicates
-
-                            sender = decode_header(msg["From"])[0][0]
-                            sender = sender.decode() if isinstance(sender, bytes) else sender
-
-                            # Remove email address in angle brackets and unwanted characters from sender name
-                            sender = re.sub(r"<.*?>", "", sender).strip()
-                            sender = re.sub(r'^"|"$', '', sender).strip()  # Remove leading/trailing quotes
-
-                            # Extract email address
-                            match = re.search(r"<(.*?)>", msg["From"])
-                            sender_email = match.group(1) if match else msg["From"]
-
-                            # Skip emails already marked in the skip or history files
-                            if sender_email in skipped_emails or sender_email in unsubscribed_emails:
-                                continue
-
-                            # Extract unsubscribe links
-                            unsubscribe_links = list(set(extract_unsubscribe_links(msg)))
-
-                            # Check if an identical entry (sender + unsubscribe links) exists
-                            if any(email for email in fetched_emails if email["sender"] == sender and set(email["unsubscribe_links"]) == set(unsubscribe_links)):
-                                continue  # Skip if an identical entry already exists
-
-                            fetched_emails.append({
-                                "subject": subject,
-                                "sender": sender,
-                                "email": sender_email,
-                                "unsubscribe_links": unsubscribe_links,
-                                "raw_msg": msg,  # Store raw message for debugging
-                            })
-                            unique_titles.add(subject)  # Mark this title as processed
-                except Exception as e:
-                    console.print(f"[red]Error fetching email ID {email_id.decode()}: {e}[/red]")
-                finally:
+    async def logout(self):
+        if self.read_task is not None and not self.read_task.done():  # Otherwise the server is gone already
+            try:
+                await self.execute("LOGOUT")
+            except (imaplib.IMAP4.error, ConnectionError):
+                pass
+        self.writer.close()
+        if self.read_task:
+            self.read_task.cancel()
+
+async def iter_emails_async(email_address, password, num_emails, batch_size=FETCH_BATCH_SIZE,
+                            search_criteria="ALL", folder=DEFAULT_FOLDER, pipeline_depth=PIPELINE_DEPTH,
+                            parse_pool=None, state=None):
+    """Asyncio counterpart of connect_to_email and iter_emails.
+
+    Whole emails are fetched over one connection, with up to ``pipeline_depth`` UID
+    FETCH commands of ``batch_size`` emails in flight, and go through the same
+    parsing and duplicate, skip and history checks as iter_emails. With a
+    ``parse_pool`` the emails are parsed in worker processes while the
+    connection keeps receiving, and fetching pauses while more than
+    PARSE_QUEUE_SIZE batches wait for a worker.
+    """
+    domain = email_address.split("@")[-1]
+    imap_server = IMAP_SERVERS.get(domain)
+    if not imap_server:
+        console.print(f"[red]Unsupported email domain: {domain}[/red]")
+        sys.exit(1)
+
+    console.print(f"Connecting to {imap_server}...")
+    client = AsyncIMAPClient()
+    await client.connect(imap_server)
+    try:
+        try:
+            await client.login(email_address, password)
+        except imaplib.IMAP4.error as e:
+            console.print(f"[red]Login failed: {e}[/red]")
+            sys.exit(1)
+        console.print("[green]Login successful![/green]")
+
+        uidvalidity = await client.select(folder)
+        email_ids = await client.uid_search(search_criteria)
+        state = state or SessionState(email_address)
+        scan = ScanFilter(state, num_emails)
+        skipped_emails = state.skipped
+        unsubscribed_emails = state.unsubscribed
+
+        async def parsed_batches(total_emails, chunks):
+            """Yield lists of parsed (UID, record, error) triples for the chunks, in order."""
+            pending = deque()  # Futures of (UID, record, error) lists from the parse workers
+            messages = []  # (UID, raw message) pairs not handed to a parse worker yet
+            with tqdm(total=total_emails, desc="Fetching Emails", unit="email", file=sys.stdout) as pbar:
+                async for email_id, attributes in client.fetch(chunks, FULL_MESSAGE_QUERY, pipeline_depth):
+                    if not isinstance(attributes.get(FULL_MESSAGE_ITEM), bytes):
+                        continue  # Unsolicited FLAGS updates carry no message
                     pbar.update(1)
+                    messages.append((email_id, attributes[FULL_MESSAGE_ITEM]))
+                    if parse_pool is None:
+                        yield read_email_batch(messages, skipped_emails, unsubscribed_emails)
+                        messages = []
+                        continue
+                    if len(messages) >= PARSE_BATCH_SIZE:
+                        pending.append(asyncio.get_running_loop().run_in_executor(
+                            parse_pool, read_email_batch, messages))
+                        messages = []
+                    # Hand on finished batches in order, and wait when the workers fall behind
+                    while pending and (pending[0].done() or len(pending) > PARSE_QUEUE_SIZE):
+                        yield await pending.popleft()
+
+            if messages:
+                pending.append(asyncio.get_running_loop().run_in_executor(parse_pool, read_email_batch, messages))
+            while pending:
+                yield await pending.popleft()
+
+        # Chunks are sent lazily, so fetching stops soon after enough emails were found
+        console.print(f"[blue]Fetching up to {len(email_ids)} emails, {batch_size} per request...[/blue]")
+        batches = parsed_batches(len(email_ids), newest_first_chunks(email_ids, batch_size))
+        try:
+            async for parsed in batches:
+                for email_id, record, error in parsed:
+                    if error is not None:
+                        console.print(f"[red]Error parsing email ID {email_id}: {error}[/red]")
+                        continue
+                    result = scan.accept(record, MessageHandle(email_address, folder, uidvalidity, email_id))
+                    if result is not None:
+                        yield result
+                        if not scan.missing:
+                            return
+        except ConnectionError as e:
+            # Like read_chunks, keep the emails found so far
+            console.print(f"[red]Stopped the scan, the connection to {imap_server} was lost: {e}[/red]")
+        finally:
+            await batches.aclose()
+    finally:
+        await client.logout()
 
-        # Adjust the number of emails to fetch based on unique titles found
-        emails_to_fetch = num_emails - len(fetched_emails)
+async def fetch_emails_async(email_address, password, num_emails, **options):
+    """Fetch emails with iter_emails_async, showing them as they are found, and return them sorted by sender."""
+    fetched_emails = [
+        show_found_email(email) async for email in iter_emails_async(email_address, password, num_emails, **options)
+    ]
 
     # Sort emails alphabetically by sender
-    fetched_emails = sorted(fetched_emails, key=lambda x: x["sender"])
-    return fetched_emails[:num_emails]  # Return only the required number of emails
+    fetched_emails.sort(key=attrgetter("sender"))
+    return fetched_emails
 
-def main():
-    if len(sys.argv) != 4:
-        console.print("[red]Usage: python3 email_unsubscribe.py {email} {password} {items}[/red]")
-        sys.exit(1)
+def parse_args():
+    """Parse the command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Fetch emails and unsubscribe from mailing lists.",
+        usage="python3 email_unsubscribe.py {email} {password} {items} [options]",
+    )
+    parser.add_argument("email", help="Email address to log in with")
+    parser.add_argument("password", help="Password (or app password) for the account")
+    parser.add_argument("items", type=int, help="Number of emails to fetch")
+    parser.add_argument("--batch-size", type=int, default=FETCH_BATCH_SIZE,
+                        help=f"Messages requested per IMAP FETCH command (default: {FETCH_BATCH_SIZE})")
+    parser.add_argument("--headers-first", action="store_true",
+                        help="Fetch only the headers first and download bodies only when they hold no unsubscribe link")
+    parser.add_argument("--body", choices=BODY_MODES, default="full",
+                        help="How much of a body to download when it is needed: the full message, only its "
+                             "text/html part, or only the end of that part (implies --headers-first)")
+    parser.add_argument("--by-sender", action="store_true",
+                        help="Sweep the From headers of the whole mailbox first and read only the newest email "
+                             "of each sender")
+    parser.add_argument("--search", default=SEARCH_CRITERIA,
+                        help=f"IMAP SEARCH criteria used to pick candidate emails (default: '{SEARCH_CRITERIA}', "
+                             f"use ALL with --since-days 0 to consider every email)")
+    parser.add_argument("--since-days", type=int, default=SEARCH_SINCE_DAYS,
+                        help=f"Only consider emails received in this many days, 0 for no limit "
+                             f"(default: {SEARCH_SINCE_DAYS})")
+    parser.add_argument("--gmail-raw", metavar="QUERY",
+                        help="Gmail search query added to the criteria, e.g. 'category:promotions unsubscribe'")
+    parser.add_argument("--engine", choices=("imaplib", "asyncio"), default="imaplib",
+                        help="IMAP engine: imaplib supports every option, asyncio pipelines whole-email fetches "
+                             "over one connection (default: imaplib)")
+    parser.add_argument("--pipeline-depth", type=int, default=PIPELINE_DEPTH,
+                        help=f"FETCH commands kept in flight by the asyncio engine (default: {PIPELINE_DEPTH})")
+    parser.add_argument("--connections", type=int, default=1,
+                        help="IMAP connections used to fetch emails in parallel, capped by the provider's limit "
+                             "(default: 1)")
+    parser.add_argument("--folder", default=DEFAULT_FOLDER,
+                        help=f"Mailbox folder to scan (default: {DEFAULT_FOLDER})")
+    parser.add_argument("--no-cache", action="store_true",
+                        help=f"Do not read or update the scan results cached in {SYNC_FILE}")
+    parser.add_argument("--parse-workers", type=int, default=0,
+                        help="Processes that parse whole emails while the connection keeps fetching, "
+                             "0 to parse in the fetching thread (default: 0)")
+    parser.add_argument("--tail-size", type=int, default=TAIL_FETCH_SIZE // 1024,
+                        help=f"Kilobytes fetched from the end of the HTML part with --body tail "
+                             f"(default: {TAIL_FETCH_SIZE // 1024})")
+    args = parser.parse_args()
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.tail_size < 1:
+        parser.error("--tail-size must be at least 1")
+    if args.pipeline_depth < 1:
+        parser.error("--pipeline-depth must be at least 1")
+    if args.connections < 1:
+        parser.error("--connections must be at least 1")
+    if args.since_days < 0:
+        parser.error("--since-days cannot be negative")
+    if args.parse_workers < 0:
+        parser.error("--parse-workers cannot be negative")
+    if args.engine == "asyncio":
+        # The asyncio engine fetches whole emails over one connection without the cache
+        unsupported = [option for option, used in (
+            ("--connections", args.connections != 1), ("--headers-first", args.headers_first),
+            ("--body", args.body != "full"), ("--by-sender", args.by_sender), ("--no-cache", args.no_cache),
+        ) if used]
+        if unsupported:
+            parser.error(f"{', '.join(unsupported)} cannot be used with --engine asyncio")
+    return args
+
+def open_unsubscribe_links(selected, state):
+    """Unsubscribe from emails with links: one-click requests run concurrently, other links open in the browser."""
+    # Senders supporting RFC 8058 are unsubscribed without opening a browser
+    one_click = {email.email: email.one_click_url for email in selected if email.one_click_url}
+    outcomes = unsubscribe_one_click(list(one_click.items())) if one_click else {}
+    if outcomes:
+        state.record_outcomes(outcomes)
+
+    for email in selected:
+        outcome = outcomes.get(email.email)
+        if outcome and outcome["status"] == "ok":
+            console.print(f"[green]Unsubscribed from {email.email} with a one-click request to "
+                          f"{email.one_click_url}[/green]")
+            continue
+        if outcome:
+            console.print(f"[yellow]One-click request for {email.email} failed ({outcome['error'] or outcome['code']}), "
+                          f"opening the links instead.[/yellow]")
+        for link in email.unsubscribe_links:
+            console.print(f"[green]Opening unsubscribe link: {link}[/green]")
+            webbrowser.open(link)
+
+def select_emails(selection, emails, unsubscribed=frozenset()):
+    """Return the indexes a bulk selection picks from emails, or None when the selection is not valid.
+
+    A selection is a comma-separated list of indexes and ranges (``0-49``,
+    ``3,7,12``), where a range stops at the last email, ``domain:NAME`` for the senders of a domain and its subdomains,
+    ``all-with-links``, ``unsubscribed`` for the senders in unsubscribed, or ``all``.
+    """
+    if selection == "unsubscribed":
+        return [idx for idx, email in enumerate(emails) if email.email in unsubscribed]
+    if selection == "all":
+        return list(range(len(emails)))
+    if selection == "all-with-links":
+        return [idx for idx, email in enumerate(emails) if email.unsubscribe_links or email.mailto_url]
+    if selection.startswith("domain:"):
+        domain = selection[len("domain:"):].lower().lstrip("@")
+        return [
+            idx for idx, email in enumerate(emails)
+            if (sender_domain := email.email.lower().rpartition("@")[2]) == domain or sender_domain.endswith("." + domain)
+        ]
+
+    indexes = []
+    for piece in selection.split(","):
+        start, dash, end = piece.strip().partition("-")
+        if not start.isdigit() or (dash and not end.isdigit()):
+            return None
+        start, end = int(start), int(end if dash else start)
+        if start > end or start >= len(emails):
+            return None
+        indexes.extend(range(start, min(end, len(emails) - 1) + 1))  # 0-49 takes whatever is shown
+    return list(dict.fromkeys(indexes))
+
+def run_bulk_command(selection, action, emails, state, clean=None):
+    """Run done, skip, skip-account or clean on every email a selection picks, as one batch with a single write.
+
+    ``clean`` removes the messages of a list of senders from the server.
+    """
+    if action not in ("done", "skip", "skip-account", "clean"):
+        console.print("[red]Invalid action. Use done, skip, skip-account or clean.[/red]")
+        return
+    indexes = select_emails(selection, emails, state.unsubscribed | state.mailto_queue.keys())
+    if indexes is None:
+        console.print("[red]Invalid selection. Use indexes and ranges (0-49, 3,7,12), domain:NAME, "
+                      "all-with-links, unsubscribed or all.[/red]")
+        return
+    if not indexes:
+        console.print("[yellow]No emails match the selection.[/yellow]")
+        return
+    if action == "clean":
+        clean(list(dict.fromkeys(emails[idx].email for idx in indexes)))
+        return
+    # Senders already handled in this session are not run again
+    handled = state.unsubscribed | state.skipped
+    selected = [emails[idx] for idx in indexes if emails[idx].email not in handled]
+    if len(selected) < len(indexes):
+        console.print(f"[yellow]Leaving out {len(indexes) - len(selected)} emails from senders already handled "
+                      f"in this session.[/yellow]")
+    if not selected:
+        return
+
+    if action in ("skip", "skip-account"):
+        added = state.skip_many([email.email for email in selected], account_only=action == "skip-account")
+        console.print(f"[green]Added {len(added)} senders to the skip list"
+                      f"{' of ' + state.user_email if action == 'skip-account' else ''}.[/green]")
+        return
 
-    user_email = sys.argv[1]
-    password = sys.argv[2]
-    num_emails = int(sys.argv[3])
+    # Add to history only the senders with unsubscribe links
+    with_links = [email for email in selected if email.unsubscribe_links]
+    added = state.mark_unsubscribed_many([email.email for email in with_links])
+    open_unsubscribe_links(with_links, state)
+    for email in selected:
+        if email.unsubscribe_links:
+            continue
+        if email.mailto_url:
+            state.queue_mailto(email.email, email.mailto_url)
+        else:
+            console.print(f"[yellow]{email.email} has no unsubscribe links and will not be added to history.[/yellow]")
+    console.print(f"[green]Marked {len(added)} senders as unsubscribed, "
+                  f"{len(state.mailto_queue)} unsubscribe emails queued to be sent on exit.[/green]")
 
-    # Load the user's history
-    user_history = get_user_history(user_email)
+def main():
+    args = parse_args()
+    user_email = args.email
+    password = args.password
+    num_emails = args.items
 
-    mail = connect_to_email(user_email, password)
-    emails = fetch_emails(mail, num_emails)
-    mail.logout()
+    # Load the user's history and skip list
+    state = SessionState(user_email)
 
-    # Filter emails that are already in the user's history
-    emails = [email for email in emails if email["email"] not in user_history]
+    search_criteria = build_search_criteria(args.search, args.since_days, args.gmail_raw)
+    parse_pool = ProcessPoolExecutor(max_workers=args.parse_workers) if args.parse_workers else None
+    try:
+        # Emails are shown as they are found, skipping those already in the user's history
+        if args.engine == "asyncio":
+            emails = asyncio.run(fetch_emails_async(
+                user_email, password, num_emails, batch_size=args.batch_size, search_criteria=search_criteria,
+                folder=args.folder, pipeline_depth=args.pipeline_depth, parse_pool=parse_pool, state=state))
+        else:
+            mail = connect_to_email(user_email, password)
+            sessions = open_connection_pool(user_email, password, args.connections, args.folder) if args.connections > 1 else []
+            emails = fetch_emails(
+                mail, num_emails, batch_size=args.batch_size, headers_first=args.headers_first, body_mode=args.body,
+                tail_size=args.tail_size * 1024, by_sender=args.by_sender, search_criteria=search_criteria,
+                account=user_email, folder=args.folder, sessions=sessions, use_cache=not args.no_cache,
+                parse_pool=parse_pool, state=state)
+            for session in sessions:
+                session.logout()
+            mail.logout()
+    finally:
+        if parse_pool is not None:
+            parse_pool.shutdown()
 
     if not emails:
         console.print(f"[yellow]No new emails found for {user_email}[/yellow]")
+        state.close()
         return
 
     display_emails(emails)
 
-    while True:
-        choice = Prompt.ask("Select an email index to open the unsubscribe link, or type 'exit' to quit, {index}-add to skip, {index}-done to mark unsubscribed")
+    server_mail = None  # Opened on the first debug or clean command, to work on messages on the server
 
-        if choice.lower() == "exit":
-            console.print("[green]Goodbye![/green]")
-            break
+    def connect_server():
+        nonlocal server_mail
+        if server_mail is None:
+            server_mail = connect_to_email(user_email, password)
+        return server_mail
 
-        # Handle adding emails to the skip list
-        if "-skip" in choice:
-            try:
-                idx = int(choice.split("-")[0])
-                if 0 <= idx < len(emails):
-                    email_choice = emails[idx]
-                    save_skipped_email(email_choice["email"])
-                    console.print(f"[green]Added {email_choice['email']} to the skip list.[/green]")
-                    continue
-                else:
-                    console.print("[red]Invalid index. Try again.[/red]")
-            except ValueError:
-                console.print("[red]Invalid input. Use the format {index}-add.[/red]")
+    def clean(senders):
+        # Removing messages cannot be undone from here, so ask first
+        who = f"1 sender ({senders[0]})" if len(senders) == 1 else f"{len(senders)} senders"
+        if not Confirm.ask(f"Remove every message from {who} in {args.folder}?", default=False):
+            console.print("[yellow]Nothing was removed.[/yellow]")
+            return None
+        return clean_senders(connect_server(), senders, args.folder)
+
+    try:
+        while True:
+            choice = Prompt.ask("Select an email index to open the unsubscribe link, or type 'exit' to quit, {index}-skip to skip, {index}-done to mark unsubscribed, {index}-skip-account to skip for this account only, {index}-debug to inspect, {index}-clean to remove all messages from the sender, or '{selection} done|skip|skip-account|clean' for several emails (e.g. 0-49 done, 3,7,12 skip, domain:temu.com done, all-with-links done, unsubscribed clean)")
+
+            if choice.lower() == "exit":
+                console.print("[green]Goodbye![/green]")
+                break
+
+            # Handle bulk commands such as "0-49 done" or "domain:temu.com skip"
+            if " " in choice.strip():
+                selection, _, action = choice.strip().rpartition(" ")
+                run_bulk_command(selection.strip(), action.lower(), emails, state, clean)
                 continue
 
-        # Handle marking emails as unsubscribed
-        if "-done" in choice or choice.isdigit():
-            try:
-                idx = int(choice.split("-")[0]) if "-done" in choice else int(choice)
-                if 0 <= idx < len(emails):
-                    email_choice = emails[idx]
-                    unsubscribe_links = email_choice.get("unsubscribe_links")
-                    if unsubscribe_links:
-                        # Add to history only if there are unsubscribe links
-                        add_to_user_history(user_email, email_choice["email"])
-                        console.print(f"[green]Marked {email_choice['email']} as unsubscribed.[/green]")
-                        for link in unsubscribe_links:
-                            console.print(f"[green]Opening unsubscribe link: {link}[/green]")
-                            webbrowser.open(link)
-                    else:
-                        console.print(f"[yellow]{email_choice['email']} has no unsubscribe links and will not be added to history.[/yellow]")
-                else:
-                    console.print("[red]Invalid index. Try again.[/red]")
-            except ValueError:
-                console.print("[red]Invalid input. Use the format {index}-done or a numeric index.[/red]")
+            # Single emails are picked as {index}-{action}, or a bare index to unsubscribe
+            match = re.fullmatch(r"(\d+)(?:-(done|skip|skip-account|debug|clean))?", choice.strip())
+            if not match:
+                console.print("[red]Invalid choice. Use {index}, {index}-done, {index}-skip, {index}-skip-account, "
+                              "{index}-debug or {index}-clean.[/red]")
+                continue
+            idx, action = int(match.group(1)), match.group(2) or "done"
+            if idx >= len(emails):
+                console.print("[red]Invalid index. Try again.[/red]")
                 continue
+            email_choice = emails[idx]
 
-        else:
-            console.print("[red]Invalid choice. Try again.[/red]")
+            # Handle showing the full message for debugging
+            if action == "debug":
+                debug_email(email_choice, connect_server())
+
+            # Handle removing all messages from a sender on the server
+            elif action == "clean":
+                clean([email_choice.email])
+
+            # Handle adding emails to the skip list
+            elif action in ("skip", "skip-account"):
+                account_only = action == "skip-account"  # Otherwise for every account
+                if state.skip(email_choice.email, account_only):
+                    console.print(f"[green]Added {email_choice.email} to the skip list"
+                                  f"{' of ' + user_email if account_only else ''}.[/green]")
+                else:
+                    console.print(f"[yellow]{email_choice.email} is already in the skip list.[/yellow]")
+
+            # Handle marking emails as unsubscribed
+            elif email_choice.unsubscribe_links:
+                # Add to history only if there are unsubscribe links
+                if state.mark_unsubscribed(email_choice.email):
+                    console.print(f"[green]{email_choice.email} added to the history for {user_email}[/green]")
+                else:
+                    console.print(f"[yellow]{email_choice.email} is already in the history for {user_email}[/yellow]")
+                console.print(f"[green]Marked {email_choice.email} as unsubscribed.[/green]")
+                open_unsubscribe_links([email_choice], state)
+            elif email_choice.mailto_url:
+                state.queue_mailto(email_choice.email, email_choice.mailto_url)
+                console.print(f"[green]Queued an unsubscribe email to {email_choice.mailto_url}, it will be "
+                              f"sent on exit.[/green]")
+            else:
+                console.print(f"[yellow]{email_choice.email} has no unsubscribe links and will not be added to history.[/yellow]")
+    except (KeyboardInterrupt, EOFError):
+        console.print("\n[green]Goodbye![/green]")
+    finally:
+        # Queued unsubscribe emails are sent however the loop ends
+        if server_mail is not None:
+            try:
+                server_mail.logout()
+            except (imaplib.IMAP4.error, OSError):
+                pass
+        state.send_queued_mailto(password)
+        state.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,31 @@
+"""Unsubscribe links found in HTML bodies, whole or read in chunks."""
+import unittest
+
+import email_unsubscribe
+
+HTML = (b'<p>Hello</p><a href="https://shop.com/deals">Deals</a>'
+        b'<a class="footer" href="https://shop.com/unsub?id=1&amp;t=2"><b>Unsubscribe</b> here</a>'
+        b"<a href='https://shop.com/prefs'>Unsubscribe from all" + b" " * 5000 + b"</a>"
+        b'<a href="https://shop.com/opt-out">Click here to stop these emails')
+
+
+class ExtractLinksTest(unittest.TestCase):
+    def test_finds_the_unsubscribe_anchors(self):
+        self.assertEqual(email_unsubscribe.extract_links_from_html_bytes(HTML),
+                         ["https://shop.com/unsub?id=1&t=2", "https://shop.com/prefs", "https://shop.com/opt-out"])
+
+    def test_chunks_give_the_same_links(self):
+        whole = email_unsubscribe.extract_links_from_html_bytes(HTML)
+        for size in (1, 5, 64, 4096):
+            chunks = (HTML[start:start + size] for start in range(0, len(HTML), size))
+            self.assertEqual(email_unsubscribe.extract_links_from_html_bytes(chunks), whole, size)
+
+    def test_carries_over_a_bounded_tail(self):
+        _, rest = email_unsubscribe.scan_anchors(b"<p>" + b"x" * 10000, final=False)
+        self.assertEqual(len(rest), email_unsubscribe.ANCHOR_WINDOW_SIZE)
+        _, rest = email_unsubscribe.scan_anchors(b'<p>x</p><a href="https://a.com/u">Unsub', final=False)
+        self.assertEqual(rest, b'<a href="https://a.com/u">Unsub')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+"""mailto: unsubscribe emails against a local SMTP server standing in for the provider."""
+import smtplib
+import socketserver
+import threading
+import unittest
+from unittest import mock
+
+import email_unsubscribe
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Speak just enough SMTP: bad@ and late@ recipients are refused, late@ only once the message was sent,
+    and a drop@ recipient closes the connection."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        self.reply("220 stand-in ESMTP")
+        recipient = ""
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb, _, rest = line.decode().strip().partition(" ")
+            verb = verb.upper()
+            command = f"{verb} {rest}".strip()
+            server.commands.append(command)
+            if verb == "EHLO":
+                self.wfile.write(b"250-stand-in\r\n" + (b"250-PIPELINING\r\n" if server.pipelining else b"")
+                                 + b"250 AUTH PLAIN LOGIN\r\n")
+            elif verb == "AUTH":
+                self.reply("235 Authenticated")
+            elif verb == "MAIL":
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipient = command
+                if "drop@" in recipient:
+                    return  # Hang up mid-transaction
+                self.reply("550 No such user" if "bad@" in recipient or "late@" in recipient else "250 OK")
+            elif verb == "DATA":
+                if "bad@" in recipient:
+                    self.reply("554 No valid recipients")
+                    continue
+                self.reply("354 Go ahead")
+                data = b""
+                while (line := self.rfile.readline()) and line != b".\r\n":
+                    data += line
+                if "late@" in recipient:
+                    self.reply("554 No valid recipients")
+                    continue
+                server.messages.append(data)
+                self.reply("250 Queued")
+            elif verb == "RSET":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Not implemented")
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class MailtoTest(unittest.TestCase):
+    pipelining = True
+
+    def setUp(self):
+        self.server = SMTPServer(("127.0.0.1", 0), SMTPHandler)
+        self.server.pipelining = self.pipelining
+        self.server.commands, self.server.messages = [], []
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        port = self.server.server_address[1]
+        # The provider is reached over plain SMTP on the stand-in's port instead of SMTP over SSL
+        for patcher in (
+            mock.patch.object(smtplib, "SMTP_SSL", lambda host, _port, timeout=None: smtplib.SMTP("127.0.0.1", port,
+                                                                                                   timeout=timeout)),
+            mock.patch.dict(email_unsubscribe.SMTP_SEND_INTERVALS, {"gmail.com": 0}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def send(self, *jobs):
+        return email_unsubscribe.send_mailto_unsubscribes("me@gmail.com", "password", jobs)
+
+    def test_sends_the_email_the_url_asks_for(self):
+        outcomes = self.send(("a@shop.com", "mailto:unsub@shop.com?subject=Remove%20me&body=Please"))
+        self.assertEqual(outcomes["a@shop.com"]["status"], "ok")
+        self.assertIn("RCPT TO:<unsub@shop.com>", self.server.commands)
+        self.assertIn(b"Subject: Remove me\r\n", self.server.messages[0])
+        self.assertIn(b"\r\n\r\nPlease\r\n", self.server.messages[0])
+
+    def test_dot_stuffs_lines_starting_with_a_dot(self):
+        outcomes = self.send(("a@shop.com", "mailto:unsub@shop.com?body=.hello%0Abye"))
+        self.assertEqual(outcomes["a@shop.com"]["status"], "ok")
+        self.assertIn(b"\r\n..hello\r\nbye\r\n", self.server.messages[0])
+
+    def test_recovers_from_a_refused_recipient(self):
+        outcomes = self.send(("a@shop.com", "mailto:bad@shop.com"), ("b@shop.com", "mailto:unsub@shop.com"))
+        self.assertEqual((outcomes["a@shop.com"]["status"], outcomes["a@shop.com"]["code"]), ("failed", 550))
+        self.assertEqual(outcomes["b@shop.com"]["status"], "ok")
+        self.assertIn("RSET", self.server.commands)
+        self.assertEqual(len(self.server.messages), 1)
+
+    def test_recovers_when_the_server_takes_the_data_of_a_refused_recipient(self):
+        outcomes = self.send(("a@shop.com", "mailto:late@shop.com"), ("b@shop.com", "mailto:unsub@shop.com"))
+        self.assertEqual((outcomes["a@shop.com"]["status"], outcomes["a@shop.com"]["code"]), ("failed", 550))
+        self.assertEqual(outcomes["b@shop.com"]["status"], "ok")
+        self.assertEqual(len(self.server.messages), 1)
+
+    def test_stops_when_the_server_disconnects(self):
+        outcomes = self.send(("a@shop.com", "mailto:unsub@shop.com"), ("b@shop.com", "mailto:drop@shop.com"),
+                             ("c@shop.com", "mailto:unsub@shop.com"))
+        self.assertEqual(outcomes["a@shop.com"]["status"], "ok")
+        self.assertEqual(outcomes["b@shop.com"]["status"], "failed")
+        self.assertEqual(outcomes["c@shop.com"]["status"], "failed")
+        self.assertIn("the SMTP session was lost", outcomes["c@shop.com"]["error"])
+        self.assertEqual(len(self.server.messages), 1)
+
+
+class MailtoWithoutPipeliningTest(MailtoTest):
+    pipelining = False
+
+    def test_sends_commands_one_at_a_time(self):
+        self.send(("a@shop.com", "mailto:unsub@shop.com"))
+        verbs = [command.split(" ")[0] for command in self.server.commands]
+        self.assertEqual(verbs[verbs.index("MAIL"):verbs.index("MAIL") + 3], ["MAIL", "RCPT", "DATA"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+"""One-click unsubscribe requests against a local HTTP server standing in for the senders."""
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import email_unsubscribe
+
+
+class SenderHandler(BaseHTTPRequestHandler):
+    """Answer one-click POSTs by path: /flaky fails once with 503, /gone is a 404, anything else is a 200."""
+    protocol_version = "HTTP/1.1"  # Keep-alive, so connections can be counted
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        with server.lock:
+            server.requests.append((self.path, body, self.headers["Content-Type"]))
+            server.connections.add(self.client_address)
+            server.attempts[self.path] = server.attempts.get(self.path, 0) + 1
+            attempts = server.attempts[self.path]
+        code = 200
+        if self.path.startswith("/flaky") and attempts == 1:
+            code = 503
+        elif self.path.startswith("/gone"):
+            code = 404
+        self.send_response(code)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+class OneClickTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), SenderHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests, self.server.connections, self.server.attempts = [], set(), {}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        patcher = mock.patch.multiple(email_unsubscribe, ONE_CLICK_RETRY_DELAY=0.01, ONE_CLICK_TIMEOUT=2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sends_the_rfc_8058_request(self):
+        outcomes = email_unsubscribe.unsubscribe_one_click([("a@shop.com", f"{self.base}/u/1?id=1")])
+        self.assertEqual(outcomes["a@shop.com"]["status"], "ok")
+        self.assertEqual(outcomes["a@shop.com"]["code"], 200)
+        self.assertEqual(self.server.requests,
+                         [("/u/1?id=1", b"List-Unsubscribe=One-Click", "application/x-www-form-urlencoded")])
+
+    def test_retries_a_server_error(self):
+        outcomes = email_unsubscribe.unsubscribe_one_click([("a@shop.com", f"{self.base}/flaky")])
+        self.assertEqual(outcomes["a@shop.com"]["status"], "ok")
+        self.assertEqual(self.server.attempts["/flaky"], 2)
+
+    def test_does_not_retry_a_client_error(self):
+        outcomes = email_unsubscribe.unsubscribe_one_click([("a@shop.com", f"{self.base}/gone")])
+        self.assertEqual(outcomes["a@shop.com"]["status"], "failed")
+        self.assertEqual(outcomes["a@shop.com"]["code"], 404)
+        self.assertEqual(self.server.attempts["/gone"], 1)
+
+    def test_reports_a_refused_connection(self):
+        # Bind and close a socket to get a local port nothing listens on
+        closed = ThreadingHTTPServer(("127.0.0.1", 0), SenderHandler)
+        port = closed.server_address[1]
+        closed.server_close()
+        outcomes = email_unsubscribe.unsubscribe_one_click([("a@shop.com", f"http://127.0.0.1:{port}/u")])
+        self.assertEqual(outcomes["a@shop.com"]["status"], "failed")
+        self.assertIsNone(outcomes["a@shop.com"]["code"])
+        self.assertTrue(outcomes["a@shop.com"]["error"])
+
+    def test_reuses_a_few_connections_per_host(self):
+        jobs = [(f"s{i}@shop.com", f"{self.base}/u/{i}") for i in range(20)]
+        outcomes = email_unsubscribe.unsubscribe_one_click(jobs)
+        self.assertEqual(sum(outcome["status"] == "ok" for outcome in outcomes.values()), 20)
+        self.assertEqual(len(self.server.requests), 20)
+        self.assertEqual(len(self.server.connections), email_unsubscribe.ONE_CLICK_CONNECTIONS_PER_HOST)
+
+
+if __name__ == "__main__":
+    unittest.main()